@@ -1,21 +1,43 @@
-import time
 import os
-from runner import get_res
+import threading
+
+from utils.startup import startup_phase, startup_report
+from utils.task_claims import TaskClaims
+from utils.task_intake import TaskIntake
+from utils.tracing import task_trace
 
 VOLUME = os.getenv("VOLUME", "/tmp/jass/research")
-processed_ids = set()
-
-while True:
-    for filename in os.listdir(VOLUME):
-        if filename.startswith("research_task_") and filename.endswith(".txt"):
-            task_id = filename[len("research_task_"):-len(".txt")]
-            if task_id in processed_ids:
-                continue
-            file_path = os.path.join(VOLUME, filename)
-            with open(file_path, 'r') as file:
-                prompt_content = file.read()
-            result_filename = f"research_result_{task_id}.txt"
-            result_path = os.path.join(VOLUME, result_filename)
-            get_res(prompt_content, result_path, task_id)
-            processed_ids.add(task_id)
-    time.sleep(10)
+MAX_CONCURRENT_TASKS = int(os.getenv("MAX_CONCURRENT_TASKS", "4"))
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "2"))
+TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", "120"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+TASK_RETRY_DELAY = float(os.getenv("TASK_RETRY_DELAY", "60"))
+
+
+def run_task(task_id: str, prompt_content: str, result_path: str):
+    # The agent is imported on first use, the intake starts without waiting for langchain
+    from runner import get_res
+
+    # Spans of the task are written to research_trace_{task_id}.jsonl next to the result
+    with task_trace(task_id, result_path):
+        get_res(prompt_content, result_path, task_id)
+
+
+def warm_up():
+    # Tasks that arrive meanwhile wait for the same import and chain
+    with startup_phase("agent"):
+        from runner import get_chain
+
+        get_chain()
+    print(startup_report())
+
+
+if __name__ == "__main__":
+    with startup_phase("intake"):
+        claims = TaskClaims(VOLUME, lease_seconds=TASK_LEASE_SECONDS)
+        intake = TaskIntake(VOLUME, run_task, max_workers=MAX_CONCURRENT_TASKS,
+                            poll_interval=POLL_INTERVAL, claims=claims,
+                            max_attempts=TASK_MAX_ATTEMPTS, retry_delay=TASK_RETRY_DELAY)
+    print(startup_report())
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    intake.run_forever()
@@ -1,20 +1,34 @@
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.memory import ChatMessageHistory
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.callbacks import BaseCallbackHandler
+
 from prompt_config import SYSTEM_GUIDE, SYSTEM_ROLE
-from runner_tools import (select_ml_service_node,
-                          generate_tasks_node, hf_fetch_tool, hf_summary_tool,
-                          github_summary_tool, arxiv_summary_tool, google_search_tool)
-from langchain_openai import ChatOpenAI
+from utils.chat_history import ChatHistoryStore, default_spill_dir
+from utils.clients import get_chat_model
+from utils.tracing import TaskTrace, current_trace
 
 
-llm = ChatOpenAI(model="gpt-4o-mini", max_tokens=8000, temperature=0.3)
+# Bounded number of histories, finished tasks release theirs
+CHAT_STORE = ChatHistoryStore(spill_dir=default_spill_dir())
 
-CHAT_STORE = {}
+# Worker threads for the blocking tool implementations of all running tasks
+AGENT_TOOL_THREADS = int(os.getenv("AGENT_TOOL_THREADS", "32"))
+_EVENT_LOOP = None
+_EVENT_LOOP_LOCK = threading.Lock()
+
+# Built by get_chain on first use, importing runner does not load langchain agents or the tools
+_CHAIN = None
+_CHAIN_LOCK = threading.Lock()
 
 
 def get_tools():
+    from runner_tools import (select_ml_service_node,
+                              generate_tasks_node, hf_fetch_tool, hf_summary_tool,
+                              github_summary_tool, arxiv_summary_tool, google_search_tool)
     tools = [
         select_ml_service_node, generate_tasks_node, hf_fetch_tool,
         google_search_tool, hf_summary_tool, github_summary_tool, arxiv_summary_tool
@@ -23,54 +37,119 @@ def get_tools():
 
 
 def get_chat_history(session_id: str):
-    if session_id not in CHAT_STORE:
-        CHAT_STORE[session_id] = ChatMessageHistory()
-    return CHAT_STORE[session_id]
-
-
-prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", SYSTEM_ROLE),
-        ("system", SYSTEM_GUIDE),
-        ("placeholder", "{chat_history}"),
-        ("human", "{input}"),
-        ("placeholder", "{agent_scratchpad}"),
-    ]
-)
-
-agent_executor = AgentExecutor(
-    agent=create_tool_calling_agent(llm, get_tools(), prompt),
-    tools=get_tools(),
-    verbose=True,
-    max_iterations=10,
-    early_stopping_method="force"
-)
-
-chain_with_history = RunnableWithMessageHistory(
-    agent_executor,
-    get_chat_history,
-    input_messages_key="input",
-    history_messages_key="chat_history"
-)
+    # Tasks run concurrently, each one must get its own history
+    return CHAT_STORE.get(session_id)
+
+
+def get_chain():
+    global _CHAIN
+    with _CHAIN_LOCK:
+        if _CHAIN is not None:
+            return _CHAIN
+        from langchain.agents import create_tool_calling_agent, AgentExecutor
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.runnables.history import RunnableWithMessageHistory
+
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", SYSTEM_ROLE),
+                ("system", SYSTEM_GUIDE),
+                ("placeholder", "{chat_history}"),
+                ("human", "{input}"),
+                ("placeholder", "{agent_scratchpad}"),
+            ]
+        )
+
+        llm = get_chat_model("gpt-4o-mini", 0.3, max_tokens=8000)
+        tools = get_tools()
+        agent_executor = AgentExecutor(
+            agent=create_tool_calling_agent(llm, tools, prompt),
+            tools=tools,
+            verbose=True,
+            max_iterations=10,
+            early_stopping_method="force"
+        )
+
+        _CHAIN = RunnableWithMessageHistory(
+            agent_executor,
+            get_chat_history,
+            input_messages_key="input",
+            history_messages_key="chat_history"
+        )
+        return _CHAIN
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    Records the agent's own model calls in the trace of its task, with their token usage.
+    Model calls made inside a tool inherit this handler, they are skipped because CompletionCache records them.
+    """
+
+    run_inline = True
+
+    def __init__(self, trace: TaskTrace):
+        self.trace = trace
+        self._starts = {}
+        # Runs of tools and of everything they started
+        self._tool_runs = set()
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._tool_runs.add(run_id)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id in self._tool_runs:
+            self._tool_runs.add(run_id)
+
+    def _end_run(self, *args, run_id, **kwargs):
+        self._tool_runs.discard(run_id)
+
+    on_tool_end = on_tool_error = on_chain_end = on_chain_error = _end_run
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        if parent_run_id in self._tool_runs:
+            return
+        self._starts[run_id] = ((metadata or {}).get("ls_model_name", ""), time.time(), time.perf_counter())
+
+    def _record(self, run_id, **fields):
+        if run_id in self._starts:
+            model, started_at, start = self._starts.pop(run_id)
+            self.trace.write("llm", model, started_at, time.perf_counter() - start, cache_hit=False, **fields)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self._record(run_id, prompt_tokens=usage.get("prompt_tokens"),
+                     completion_tokens=usage.get("completion_tokens"))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._record(run_id, error=type(error).__name__)
+
+
+def _config(session_id) -> dict:
+    trace = current_trace()
+    return {"configurable": {"session_id": session_id},
+            "callbacks": [TraceCallbackHandler(trace)] if trace is not None else []}
 
 
 def chat(input, session_id):
-    res = chain_with_history.invoke({"input": input},
-                                    config={"configurable": {"session_id": session_id}})['output']
+    res = get_chain().invoke({"input": input}, config=_config(session_id))['output']
     return res
 
 
-def get_res(prompt: str, save_dir: str, id_: str):
-    res = chat(prompt, id_)
-    if "### ArXiv Papers" in res:
-        res = chat("To current summary add additional summary for arxiv links", id_)
+async def achat(input, session_id):
+    # The tool calls of one turn are gathered, so a turn takes as long as its slowest tool
+    res = await get_chain().ainvoke({"input": input}, config=_config(session_id))
+    return res['output']
 
-    if "### Hugging Face" in res:
-        res = chat("To current summary add additional summary"
-                   " for each HuggingFace link and Usefull links on GitHub found in paper", id_)
 
-    if "### Github Links" in res:
-        res = chat("To current summary add additional summary for github repositories", id_)
+async def aget_res(prompt: str, save_dir: str, id_: str):
+    from runner_enrichment import enrich_report
+
+    try:
+        res = await achat(prompt, id_)
+    finally:
+        CHAT_STORE.release(id_)
+    # Links of the ArXiv, GitHub and Hugging Face sections are summarized concurrently, without follow-up turns
+    res = await asyncio.to_thread(enrich_report, res)
 
     print("End of execution...")
     print(res)
@@ -78,3 +157,22 @@ def get_res(prompt: str, save_dir: str, id_: str):
         res_b.write(res)
         print(f"Saved Research to {save_dir}")
 
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    # One loop for all tasks, the async LLM client must not be shared between event loops
+    global _EVENT_LOOP
+    with _EVENT_LOOP_LOCK:
+        if _EVENT_LOOP is None:
+            _EVENT_LOOP = asyncio.new_event_loop()
+            _EVENT_LOOP.set_default_executor(ThreadPoolExecutor(max_workers=AGENT_TOOL_THREADS,
+                                                                thread_name_prefix="agent-tool"))
+            threading.Thread(target=_EVENT_LOOP.run_forever, name="agent-loop", daemon=True).start()
+        return _EVENT_LOOP
+
+
+def get_res(prompt: str, save_dir: str, id_: str):
+    # Called from the task threads, blocks until the task finished on the shared loop.
+    # A cold chain is built here rather than on the loop, where it would stall the running tasks
+    get_chain()
+    asyncio.run_coroutine_threadsafe(aget_res(prompt, save_dir, id_), get_event_loop()).result()
+
@@ -0,0 +1,154 @@
+"""
+Enrichment of a finished research report.
+
+The links of every report section are summarized concurrently and the summaries are appended to their
+sections in a fixed order, instead of asking the agent for one follow-up turn per section.
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from tools.gh_search import summarize_repository
+from tools.github_client import README_NOT_AVAILABLE
+from tools.hf_search import NO_SUMMARY, HuggingFaceSearch
+from tools.utils_text_summary_tools import Summarizer
+from utils.tracing import propagate
+
+ENRICHMENT_CONCURRENCY = int(os.getenv("ENRICHMENT_CONCURRENCY", "8"))
+# Links summarized per section, the agent lists the most relevant ones first
+ENRICHMENT_MAX_LINKS = int(os.getenv("ENRICHMENT_MAX_LINKS", "5"))
+
+HEADING = re.compile(r'^[ \t]*(?:\d+\.[ \t]*)?(#{2,4})[ \t]+(.+?)[ \t]*$', re.MULTILINE)
+ARXIV_LINK = re.compile(r'https?://(?:export\.)?arxiv\.org/(?:abs|pdf)/[\w.\-/]+\w')
+GITHUB_LINK = re.compile(r'https?://github\.com/[\w\-.]+/[\w\-]+(?:\.[\w\-]+)*')
+HF_LINK = re.compile(r'https?://huggingface\.co/[\w\-./]+\w')
+
+# Heading keyword of a section kind -> link pattern of the section
+SECTION_KINDS = [
+    ("arxiv", ARXIV_LINK),
+    ("github", GITHUB_LINK),
+    ("hugging face", HF_LINK),
+]
+
+
+def split_sections(report: str) -> List[Tuple[int, str, str]]:
+    """
+    Split a report by its headings.
+    :param report: Markdown report
+    :return: (level, heading, text) triples in report order, the text includes the heading line,
+        text before the first heading has level 0 and an empty heading
+    """
+    starts = [match.start() for match in HEADING.finditer(report)]
+    bounds = [0] + starts + [len(report)]
+    sections = []
+    for start, end in zip(bounds, bounds[1:]):
+        if start == end:
+            continue
+        match = HEADING.match(report, start)
+        if match:
+            sections.append((len(match.group(1)), match.group(2), report[start:end]))
+        else:
+            sections.append((0, "", report[start:end]))
+    return sections
+
+
+def section_kinds(sections: List[Tuple[int, str, str]]) -> List[Optional[str]]:
+    """
+    Find the kind of every section, subheadings without a keyword inherit the kind of their parent.
+    :param sections: Sections of split_sections
+    :return: Keyword of SECTION_KINDS or None per section
+    """
+    kinds, parents = [], []
+    for level, heading, _ in sections:
+        while parents and parents[-1][0] >= level:
+            parents.pop()
+        heading = heading.lower()
+        kind = next((keyword for keyword, _ in SECTION_KINDS if keyword in heading), None)
+        if kind is None and parents:
+            kind = parents[-1][1]
+        parents.append((level, kind))
+        kinds.append(kind)
+    return kinds
+
+
+def extract_links(text: str, pattern: re.Pattern, max_links: int = ENRICHMENT_MAX_LINKS) -> List[str]:
+    """
+    Find distinct links in a text.
+    :param text: Section text
+    :param pattern: Link pattern
+    :param max_links: Maximum number of links
+    :return: Links in order of appearance
+    """
+    links = []
+    for link in pattern.findall(text):
+        link = link.removesuffix('.git')
+        if link not in links:
+            links.append(link)
+    return links[:max_links]
+
+
+def summarize_arxiv(link: str) -> Optional[str]:
+    summary, _ = Summarizer().summarize_paper(link)
+    return summary
+
+
+def summarize_github(link: str) -> Optional[str]:
+    summary = summarize_repository(*link.split("/")[-2:])
+    if summary.get('readme_summary') in (None, README_NOT_AVAILABLE):
+        return None
+    code = "\n".join(f"- `{files}`: {text}" for files, text in (summary.get('code_summaries') or {}).items()
+                     if text)
+    return summary['readme_summary'] + (f"\n\nCode:\n{code}" if code else "")
+
+
+def summarize_hf(link: str) -> Optional[str]:
+    summary = HuggingFaceSearch().summarize_page(link)
+    return None if summary == NO_SUMMARY else summary
+
+
+# Section kind -> summary of one link, None when there is nothing to add
+SUMMARIZERS = {
+    "arxiv": summarize_arxiv,
+    "github": summarize_github,
+    "hugging face": summarize_hf,
+}
+
+
+def _summarize(kind: str, link: str) -> Optional[str]:
+    try:
+        summary = SUMMARIZERS[kind](link)
+    except Exception as e:
+        print(f"Enrichment of {link} failed: {e}")
+        return None
+    return summary.strip() if summary else None
+
+
+def enrich_report(report: str, max_workers: int = ENRICHMENT_CONCURRENCY) -> str:
+    """
+    Summarize the links of every known section concurrently and append the summaries to their sections.
+    :param report: Report of the agent
+    :param max_workers: Maximum number of concurrent summaries
+    :return: Report with a summary under every link that could be summarized
+    """
+    sections = split_sections(report)
+    patterns = dict(SECTION_KINDS)
+    section_jobs = []
+    for (_, _, text), kind in zip(sections, section_kinds(sections)):
+        section_jobs.append([(kind, link) for link in extract_links(text, patterns[kind])] if kind else [])
+    # A link listed in two sections of the same kind is summarized once
+    jobs = list(dict.fromkeys(job for jobs_of_section in section_jobs for job in jobs_of_section))
+    if not jobs:
+        return report
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        summaries = dict(zip(jobs, pool.map(propagate(lambda job: _summarize(*job)), jobs)))
+
+    enriched = []
+    for (_, _, text), jobs_of_section in zip(sections, section_jobs):
+        done = [(link, summaries[(kind, link)]) for kind, link in jobs_of_section if summaries[(kind, link)]]
+        if done:
+            text = text.rstrip('\n') + "\n\n" + "\n\n".join(f"**Summary of {link}**\n{summary}"
+                                                         for link, summary in done) + "\n\n"
+        enriched.append(text)
+    return "".join(enriched)
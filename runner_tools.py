@@ -1,15 +1,61 @@
+import asyncio
+import functools
 import os
 
-import requests
 from langchain_core.tools import tool
-from langchain_openai import OpenAIEmbeddings
 
 from tools.gh_search import summarize_repository
+from tools.hf_catalog import get_hub_catalog
 from tools.hf_search import HuggingFaceSearch
+from tools.arxiv_index import get_arxiv_index
 from tools.arxiv_search import ArXivSemanticSearch, ArxivQuery
 from tools.utils_text_summary_tools import Summarizer
+from utils.clients import get_embeddings
+from utils.http_cache import cached_get
+from utils.tool_output import shape_output
+from utils.tracing import span
+
+# "local" searches the index built by `python -m tools.arxiv_index` instead of the arXiv API
+ARXIV_BACKEND = os.getenv("ARXIV_BACKEND", "live")
+# "hybrid" embeds only the BM25 top candidates of a live search, "semantic" embeds all of them
+ARXIV_RETRIEVAL = os.getenv("ARXIV_RETRIEVAL", "hybrid")
+# "local" answers Hugging Face listing queries from the snapshot built by `python -m tools.hf_catalog`
+HF_BACKEND = os.getenv("HF_BACKEND", "live")
+# Tokens of every tool output sent back to the agent
+TOOL_TOKEN_BUDGETS = {
+    "hf_fetch_tool": 800,
+    "hf_summary_tool": 1000,
+    "github_summary_tool": 1500,
+    "arxiv_summary_tool": 1500,
+    "arxic_fetch_tool": 1200,
+    "google_search_tool": 600,
+}
+
+
+def async_tool(sync_tool):
+    """
+    Give a tool a coroutine that runs its blocking implementation in a worker thread,
+    so the tool calls of one agent turn are awaited concurrently. Every call is traced.
+    """
+    func = sync_tool.func
+
+    @functools.wraps(func)
+    def traced(*args, **kwargs):
+        with span("tool", sync_tool.name) as record:
+            output = func(*args, **kwargs)
+            record["chars"] = len(str(output))
+            return output
 
+    @functools.wraps(func)
+    async def coroutine(*args, **kwargs):
+        return await asyncio.to_thread(traced, *args, **kwargs)
 
+    sync_tool.func = traced
+    sync_tool.coroutine = coroutine
+    return sync_tool
+
+
+@async_tool
 @tool
 def select_ml_service_node(arch: str):
     """
@@ -19,6 +65,7 @@ def select_ml_service_node(arch: str):
             f" for them from provided service arch. Don't miss details: {arch}. ML_Service:")
 
 
+@async_tool
 @tool
 def generate_tasks_node(ml_service_information: str):
     """Useful to convert ML_service to a list of tasks for comprehensive up-to date ML research"""
@@ -27,6 +74,7 @@ def generate_tasks_node(ml_service_information: str):
             f" and aim to find the most up-to-date and effective solutions."
             f"Ml Service description: {ml_service_information}. Tasks:")
 
+@async_tool
 @tool
 def hf_fetch_tool(info_type: str, query: str):
     """
@@ -37,10 +85,11 @@ def hf_fetch_tool(info_type: str, query: str):
         :param query: The search query or keywords that will be used. Must be related to a research task
         :return: List of dictionaries for models and datasets
     """
-    hf = HuggingFaceSearch()
-    result = [r for r in hf.huggingface_info_by_context(info_type, query, total_pages=1)]
-    return "Result of HF research: {}".format(result)
+    hf = HuggingFaceSearch(catalog=get_hub_catalog() if HF_BACKEND == "local" else None)
+    result = list(hf.huggingface_info_by_context(info_type, query, total_pages=1))
+    return shape_output("Result of HF research", result, TOOL_TOKEN_BUDGETS["hf_fetch_tool"])
 
+@async_tool
 @tool
 def hf_summary_tool(page_url: str) -> str:
     """
@@ -49,9 +98,11 @@ def hf_summary_tool(page_url: str) -> str:
             :return: Full summary of the page
     """
     hf = HuggingFaceSearch()
-    return f"HF Summary: {hf.summarize_page(page_url)}"
+    return shape_output("HF Summary", hf.summarize_page(page_url), TOOL_TOKEN_BUDGETS["hf_summary_tool"],
+                        field_chars=None)
 
 
+@async_tool
 @tool
 def github_summary_tool(github_link: str):
     """
@@ -60,9 +111,10 @@ def github_summary_tool(github_link: str):
                :return: Full summary of the page
     """
     summary = summarize_repository(*github_link.split("/")[-2:])
-    return "Git summary: {}".format(summary)
+    return shape_output("Git summary", summary, TOOL_TOKEN_BUDGETS["github_summary_tool"], field_chars=1500)
 
 
+@async_tool
 @tool
 def arxiv_summary_tool(arxiv_link: str):
     """
@@ -75,8 +127,9 @@ def arxiv_summary_tool(arxiv_link: str):
         result = summer.summarize_text_pipeline(arxiv_link)
     except Exception as e:
         return "Can't return arXiv summary"
-    return "ArXiv Summary: {}".format(result)
+    return shape_output("ArXiv Summary", result, TOOL_TOKEN_BUDGETS["arxiv_summary_tool"], field_chars=None)
 
+@async_tool
 @tool
 def arxic_fetch_tool(query: ArxivQuery):
     """
@@ -88,21 +141,23 @@ def arxic_fetch_tool(query: ArxivQuery):
     :param similarity_threshold: Minimum cosine similarity to return results
     :return: List of relevant papers sorted by semantic similarity
     """
-    embeddings = OpenAIEmbeddings(
+    embeddings = get_embeddings(
         model="text-embedding-ada-002",  # This is the default and most cost-effective model
         chunk_size=1000  # Number of texts to embed in each batch
     )
-    arxic_search = ArXivSemanticSearch(embeddings)
+    index = get_arxiv_index() if ARXIV_BACKEND == "local" else None
+    arxic_search = ArXivSemanticSearch(embeddings, index=index, retrieval=ARXIV_RETRIEVAL)
     try:
         result = arxic_search.semantic_search(query, max_results=5,
-                                              similarity_threshold=0.3)
+                                              similarity_threshold=0.3, min_candidates=20)
     except ValueError as exc:
         print(exc)
         return "None Papers Found"
 
-    return "ArXiv fetching results {}".format(result)
+    return shape_output("ArXiv fetching results", result, TOOL_TOKEN_BUDGETS["arxic_fetch_tool"], field_chars=400)
 
 
+@async_tool
 @tool
 def google_search_tool(search_query: str):
     """Useful to find information in internet for arXiv papers and Github repos"""
@@ -116,13 +171,13 @@ def google_search_tool(search_query: str):
         "q": search_query,
     }
 
-    response = requests.get(url, params=params)
+    response = cached_get(url, params=params)
 
     result = []
     if response.status_code == 200:
         data = response.json()
         for item in data.get("items", []):
             result.append({"title": item['title'], "link": item['link']})
-        return f"Result from google: {result}"
+        return shape_output("Result from google", result, TOOL_TOKEN_BUDGETS["google_search_tool"])
     else:
         return "Can't find anything"
@@ -0,0 +1,84 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from tools import arxiv_index
+from tools.arxiv_index import ArxivLocalIndex, get_arxiv_index
+from tools.arxiv_query_data_model import ArxivQuery, Paper
+from tools.arxiv_search import ArXivSemanticSearch
+from utils import embedding_cache
+from utils.embedding_cache import EmbeddingCache
+
+PAPERS = [
+    Paper(title="Capsule networks", summary="Routing between capsules.", link="http://arxiv.org/pdf/1710.09829v2",
+          authors=["Sara Sabour", "Geoffrey E. Hinton"], categories=["cs.CV"], published="2017-10-26",
+          semantic_score=0),
+    Paper(title="Graph attention networks", summary="Attention on graphs.", link="http://arxiv.org/pdf/1710.10903v3",
+          authors=["Petar Velickovic"], categories=["stat.ML", "cs.LG"], published="2017-10-30", semantic_score=0),
+    Paper(title="Forward-forward algorithm", summary="Training without backprop.",
+          link="http://arxiv.org/pdf/2212.13345v1", authors=["Geoffrey Hinton"], categories=["cs.LG"],
+          published="2022-12-27", semantic_score=0),
+]
+
+
+class FakeEmbeddings:
+    model = "fake-embeddings"
+
+    def embed_documents(self, texts):
+        # Every text is equally similar, the filters decide the result
+        return [[1.0, 0.0] for _ in texts]
+
+
+@pytest.fixture
+def search(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "_embedding_cache", EmbeddingCache(str(tmp_path / "embeddings.sqlite")))
+    index = ArxivLocalIndex(str(tmp_path / "index"))
+    index.add(PAPERS, np.ones((len(PAPERS), 2), dtype=np.float32), "fake-embeddings")
+    return ArXivSemanticSearch(FakeEmbeddings(), index=index)
+
+
+def titles(papers):
+    return sorted(paper.title for paper in papers)
+
+
+def test_local_search_applies_filters(search):
+    assert titles(search.search_local(ArxivQuery(author="hinton"), similarity_threshold=0)) == [
+        "Capsule networks", "Forward-forward algorithm"]
+    assert titles(search.search_local(ArxivQuery(all_fields="learning", category="cs.LG"),
+                                      similarity_threshold=0)) == ["Forward-forward algorithm",
+                                                                   "Graph attention networks"]
+    papers = search.search_local(ArxivQuery(author="Hinton", date_range="[20220101 TO 20231231]"),
+                                 similarity_threshold=0)
+    assert titles(papers) == ["Forward-forward algorithm"]
+    assert papers[0].categories == ["cs.LG"] and papers[0].published == "2022-12-27"
+
+
+def test_local_search_without_match_falls_back_to_api(search):
+    assert search.search_local(ArxivQuery(author="LeCun"), similarity_threshold=0) is None
+    assert len(search.search_local(ArxivQuery(all_fields="networks"), similarity_threshold=0)) == 3
+
+
+def test_old_index_gets_filter_columns(tmp_path):
+    directory = tmp_path / "index"
+    directory.mkdir()
+    db = sqlite3.connect(directory / "metadata.sqlite")
+    db.execute("CREATE TABLE papers (row INTEGER PRIMARY KEY, arxiv_id TEXT UNIQUE NOT NULL, title TEXT NOT NULL,"
+               " summary TEXT NOT NULL, link TEXT NOT NULL, authors TEXT NOT NULL, added_at REAL NOT NULL)")
+    db.commit()
+    db.close()
+
+    index = ArxivLocalIndex(str(directory))
+    index.add(PAPERS[:1], np.ones((1, 2), dtype=np.float32), "fake-embeddings")
+    assert index.filter_rows(ArxivQuery(category="cs.CV")) == [0]
+
+
+def test_index_is_opened_once_per_process(tmp_path, monkeypatch):
+    monkeypatch.setenv("ARXIV_INDEX_DIR", str(tmp_path / "index"))
+    monkeypatch.setattr(arxiv_index, "_arxiv_index", None)
+    index = get_arxiv_index()
+    index.add(PAPERS, np.ones((len(PAPERS), 2), dtype=np.float32), "fake-embeddings")
+    matrix = index.matrix()
+
+    assert get_arxiv_index() is index
+    assert get_arxiv_index().matrix() is matrix
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from tools import arxiv_search
+from tools.arxiv_query_data_model import ArxivQuery
+from tools.arxiv_search import ArXivSemanticSearch
+from utils import embedding_cache
+from utils.embedding_cache import EmbeddingCache
+
+TOPICS = ["graph neural networks", "speech recognition", "protein folding", "image segmentation"]
+
+
+def feed(start, count, total):
+    entries = []
+    for i in range(start, min(start + count, total)):
+        entries.append(f"""<entry>
+<title>Paper {i} on {TOPICS[i % len(TOPICS)]}</title>
+<summary>We study {TOPICS[i % len(TOPICS)]} with method {i}.</summary>
+<link title="pdf" href="http://arxiv.org/pdf/2401.{i:05d}v1"/>
+<author><name>Author {i}</name></author>
+</entry>""")
+    return f'<feed xmlns="http://www.w3.org/2005/Atom">{"".join(entries)}</feed>'
+
+
+class FakeEmbeddings:
+    model = "fake-embeddings"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(topic in text) for topic in TOPICS] + [0.1] for text in texts]
+
+
+@pytest.fixture
+def arxiv(tmp_path, monkeypatch):
+    """Serve a fake arXiv API with 250 results and record the requested URLs."""
+    requests = []
+
+    @contextmanager
+    def download_to_file(url, **kwargs):
+        params = parse_qs(urlsplit(url).query)
+        requests.append(url)
+        path = tmp_path / f"feed_{len(requests)}.xml"
+        path.write_text(feed(int(params["start"][0]), int(params["max_results"][0]), 250))
+        yield str(path)
+
+    monkeypatch.setattr(arxiv_search, "download_to_file", download_to_file)
+    monkeypatch.setattr(embedding_cache, "_embedding_cache", EmbeddingCache(str(tmp_path / "embeddings.sqlite")))
+    return requests
+
+
+def test_hybrid_search_fetches_candidates_in_one_request(arxiv):
+    search = ArXivSemanticSearch(FakeEmbeddings(), max_papers=1000, retrieval="hybrid", lexical_top_n=50)
+    papers = search.semantic_search(ArxivQuery(all_fields="protein folding"), max_results=3,
+                                    similarity_threshold=0.3, min_candidates=20)
+
+    assert len(arxiv) == 1
+    assert "max_results=1000" in arxiv[0]
+    assert papers and all("protein folding" in paper.title for paper in papers)
+
+
+@pytest.mark.parametrize("retrieval", ["semantic", "hybrid"])
+def test_search_fetches_once_and_repeated_search_embeds_nothing(arxiv, retrieval):
+    embeddings = FakeEmbeddings()
+    search = ArXivSemanticSearch(embeddings, max_papers=100, retrieval=retrieval)
+    query = ArxivQuery(all_fields="speech recognition")
+
+    first = search.semantic_search(query, max_results=5, similarity_threshold=0.3)
+    assert len(arxiv) == 1
+    embedded = len(embeddings.embedded)
+    assert embedded > 0
+
+    second = search.semantic_search(query, max_results=5, similarity_threshold=0.3)
+    assert len(arxiv) == 2
+    assert len(embeddings.embedded) == embedded
+    assert [paper.link for paper in second] == [paper.link for paper in first]
@@ -0,0 +1,34 @@
+import os
+
+from utils.chat_history import ChatHistoryStore
+
+
+def test_evicted_live_session_is_reloaded(tmp_path):
+    store = ChatHistoryStore(max_sessions=1, spill_dir=str(tmp_path))
+    store.get("0").add_user_message("research task")
+    store.get("1")
+
+    assert len(os.listdir(tmp_path)) == 1
+    assert [message.content for message in store.get("0").messages] == ["research task"]
+    # "1" had no messages, nothing is spilled for it
+    assert os.listdir(tmp_path) == []
+
+
+def test_released_sessions_leave_nothing_on_disk(tmp_path):
+    store = ChatHistoryStore(max_sessions=1, spill_dir=str(tmp_path))
+    for task_id in ("0", "1", "2"):
+        store.get(task_id).add_user_message(f"task {task_id}")
+        store.get(task_id).add_ai_message("report")
+        store.release(task_id)
+
+    assert len(store) == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_release_removes_spilled_history(tmp_path):
+    store = ChatHistoryStore(max_sessions=1, spill_dir=str(tmp_path))
+    store.get("0").add_user_message("research task")
+    store.get("1")
+    store.release("0")
+
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,58 @@
+import io
+import threading
+import time
+
+import requests
+
+from utils import http_client
+from utils.http_cache import HttpCache
+from utils.http_client import HttpClient
+
+FEED_URL = "http://export.arxiv.org/api/query?search_query=all:speech&start=0&max_results=100"
+
+
+def test_requests_to_a_host_are_spaced():
+    client = HttpClient(host_intervals={"export.arxiv.org": 0.05})
+    times = []
+    for _ in range(3):
+        client.wait_for_turn(FEED_URL)
+        times.append(time.monotonic())
+    assert all(later - earlier >= 0.045 for earlier, later in zip(times, times[1:]))
+    assert client.wait_for_turn("https://huggingface.co/api/models") == 0
+
+
+def test_waiting_host_does_not_block_other_requests():
+    client = HttpClient(host_intervals={"export.arxiv.org": 0.5})
+    client.wait_for_turn(FEED_URL)
+    waiting = threading.Thread(target=client.wait_for_turn, args=(FEED_URL,))
+    waiting.start()
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    client._slot("https://huggingface.co/api/models")
+    assert client.wait_for_turn("https://huggingface.co/api/models") == 0
+    assert time.monotonic() - start < 0.1
+    waiting.join()
+
+
+def test_cached_arxiv_pages_are_not_spaced(tmp_path, monkeypatch):
+    client = HttpClient(host_intervals={"export.arxiv.org": 60})
+    sent = []
+
+    def send(method, url, **kwargs):
+        sent.append(url)
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.raw = io.BytesIO(b'<feed xmlns="http://www.w3.org/2005/Atom"></feed>')
+        return response
+
+    monkeypatch.setattr(client.session, "request", send)
+    monkeypatch.setattr(http_client, "_http_client", client)
+    cache = HttpCache(str(tmp_path / "http"))
+
+    start = time.monotonic()
+    for _ in range(3):
+        cache.fetch_file(FEED_URL)
+    assert len(sent) == 1
+    assert time.monotonic() - start < 1
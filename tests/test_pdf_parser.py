@@ -0,0 +1,59 @@
+import os
+from contextlib import contextmanager
+
+import pytest
+
+PyPDF2 = pytest.importorskip("PyPDF2")
+
+from utils import pdf_parser
+from utils.pdf_parser import PDFParser
+
+
+@pytest.fixture
+def blank_pdf(tmp_path):
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pdf_parser.PARALLEL_MIN_PAGES + 2):
+        writer.add_blank_page(width=200, height=200)
+    path = tmp_path / "blank.pdf"
+    with open(path, 'wb') as pdf_file:
+        writer.write(pdf_file)
+    return str(path)
+
+
+def test_broken_pool_is_replaced(monkeypatch, blank_pdf):
+    monkeypatch.setattr(pdf_parser, "PDF_WORKERS", 2)
+    # A worker that dies breaks the pool, like a PDF that crashes the parser
+    with pytest.raises(Exception):
+        pdf_parser._get_pool().submit(os._exit, 1).result()
+
+    text, uris, complete = PDFParser.extract_document(blank_pdf, parallel=True)
+    assert complete
+    assert text.count("\n") == pdf_parser.PARALLEL_MIN_PAGES + 2
+
+
+@pytest.mark.parametrize("extracted, stored", [
+    (("Full text\n", [], True), ["2401.00001"]),
+    (("First pages\n", [], False), []),
+    (("\n\n", [], True), []),
+])
+def test_only_complete_text_is_stored(monkeypatch, blank_pdf, extracted, stored):
+    puts = []
+
+    class Store:
+        def get(self, paper_id):
+            return None
+
+        def put(self, paper_id, text, links):
+            puts.append(paper_id)
+
+    @contextmanager
+    def open_pdf(self, max_bytes=None):
+        yield blank_pdf
+
+    monkeypatch.setattr(pdf_parser, "get_paper_store", lambda: Store())
+    monkeypatch.setattr(PDFParser, "open_pdf", open_pdf)
+    monkeypatch.setattr(PDFParser, "extract_document", classmethod(lambda cls, path: extracted))
+
+    result = PDFParser("https://arxiv.org/abs/2401.00001").process_pdf_url()
+    assert result["text"] == extracted[0]
+    assert puts == stored
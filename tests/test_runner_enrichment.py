@@ -0,0 +1,69 @@
+import pytest
+
+import runner_enrichment
+from runner_enrichment import enrich_report, section_kinds, split_sections
+
+REPORT = """# Research report
+
+## ArXiv papers
+1. Paper one https://arxiv.org/abs/2401.00001
+
+#### Efficient variants
+- https://arxiv.org/abs/2401.00002
+
+## GitHub repositories
+- https://github.com/owner/repo.git
+- again https://github.com/owner/repo
+
+## Hugging Face models
+- https://huggingface.co/org/model
+
+## Conclusion
+Nothing to summarize https://arxiv.org/abs/2401.00003
+"""
+
+
+@pytest.fixture
+def summarizers(monkeypatch):
+    calls = []
+
+    def fake(kind):
+        def summarize(link):
+            calls.append((kind, link))
+            if link.endswith("model"):
+                return None
+            return f"- {kind} point\n- second point"
+        return summarize
+
+    monkeypatch.setattr(runner_enrichment, "SUMMARIZERS", {kind: fake(kind) for kind in runner_enrichment.SUMMARIZERS})
+    return calls
+
+
+def test_subheadings_inherit_section_kind():
+    sections = split_sections(REPORT)
+    assert section_kinds(sections) == [None, "arxiv", "arxiv", "github", "hugging face", None]
+
+
+def test_enrich_report_appends_clean_summaries(summarizers):
+    enriched = enrich_report(REPORT)
+
+    assert sorted(summarizers) == [
+        ("arxiv", "https://arxiv.org/abs/2401.00001"),
+        ("arxiv", "https://arxiv.org/abs/2401.00002"),
+        ("github", "https://github.com/owner/repo"),
+        ("hugging face", "https://huggingface.co/org/model"),
+    ]
+    assert "**Summary of https://arxiv.org/abs/2401.00002**\n- arxiv point\n- second point" in enriched
+    assert enriched.count("**Summary of https://github.com/owner/repo**") == 1
+    # Links without a summary and sections of other kinds are left as they are
+    assert "Summary of https://huggingface.co" not in enriched
+    assert "Summary of https://arxiv.org/abs/2401.00003" not in enriched
+    assert enriched.index("Summary of https://arxiv.org/abs/2401.00001") < enriched.index("## GitHub")
+
+
+def test_failed_summary_is_skipped(monkeypatch):
+    def fail(link):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(runner_enrichment, "SUMMARIZERS", {kind: fail for kind in runner_enrichment.SUMMARIZERS})
+    assert enrich_report(REPORT) == REPORT
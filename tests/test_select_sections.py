@@ -0,0 +1,43 @@
+from utils.pdf_parser import PDFParser
+
+# Layout of "Attention Is All You Need"
+PAPER = """Attention Is All You Need
+Abstract
+The dominant sequence transduction models are based on recurrent networks.
+1 Introduction
+Recurrent neural networks have been established as state of the art.
+2 Background
+The goal of reducing sequential computation also forms the foundation.
+3 Model Architecture
+Most competitive neural sequence transduction models have an encoder-decoder structure.
+3.1 Encoder and Decoder Stacks
+The encoder is composed of a stack of N = 6 identical layers.
+4 Why Self-Attention
+We compare various aspects of self-attention layers to recurrent layers.
+5 Experiments
+We trained on the standard WMT 2014 English-German dataset.
+5.1 Hardware and Schedule
+We trained our models on one machine with 8 NVIDIA P100 GPUs.
+6 Related Work
+Earlier work on sequence modeling.
+7 Conclusion
+In this work, we presented the Transformer.
+References
+[1] Jimmy Lei Ba, Jamie Ryan Kiros, and Geoffrey E Hinton. Layer normalization.
+"""
+
+
+def test_unknown_numbered_sections_are_kept():
+    selected = PDFParser.select_sections(PAPER)
+
+    for kept in ("dominant sequence transduction", "Recurrent neural networks", "3 Model Architecture",
+                 "encoder-decoder structure", "3.1 Encoder and Decoder Stacks", "stack of N = 6",
+                 "4 Why Self-Attention", "we presented the Transformer"):
+        assert kept in selected
+    for dropped in ("WMT 2014", "5.1 Hardware", "8 NVIDIA P100", "Earlier work", "Layer normalization"):
+        assert dropped not in selected
+
+
+def test_text_without_headings_is_kept_up_to_references():
+    text = "Some text\nMore text\nReferences\n[1] A citation"
+    assert PDFParser.select_sections(text) == "Some text\nMore text"
@@ -0,0 +1,32 @@
+import pytest
+
+from tools import utils_text_summary_tools
+from tools.utils_text_summary_tools import Summarizer, map_reduce_summarize
+
+
+@pytest.fixture(autouse=True)
+def split_by_paragraph(monkeypatch):
+    # Token counting needs the tiktoken encoding files, paragraphs stand in for token chunks
+    monkeypatch.setattr(utils_text_summary_tools, "split_text_by_tokens", lambda text, tokens: text.split("\n\n"))
+    monkeypatch.setattr(utils_text_summary_tools, "count_tokens", len)
+
+
+def test_map_reduce_without_any_summary_returns_empty_text():
+    assert map_reduce_summarize("one\n\ntwo", lambda chunk: None, lambda text: None) == ""
+    assert map_reduce_summarize("one", lambda chunk: None, lambda text: None) == ""
+
+
+def test_map_reduce_combines_chunk_summaries():
+    summary = map_reduce_summarize("one\n\ntwo\n\nthree", lambda chunk: chunk.upper(),
+                                   lambda text: text.replace("\n\n", " + "), chunk_tokens=100)
+    assert summary == "ONE + TWO + THREE"
+
+
+def test_paper_without_summary_raises_clear_error(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(utils_text_summary_tools.PDFParser, "process_pdf_url",
+                        lambda self, selective=False: {"text": "one\n\ntwo", "links": []})
+    monkeypatch.setattr(Summarizer, "summarize_text", lambda self, text, bypass_cache=False: None)
+
+    with pytest.raises(ValueError, match="No summary"):
+        Summarizer().summarize_text_pipeline("https://arxiv.org/abs/2401.00001")
@@ -0,0 +1,59 @@
+import os
+import threading
+
+from utils.task_claims import TaskClaims
+from utils.task_intake import TaskIntake
+
+
+def write_tasks(volume, count):
+    for i in range(count):
+        with open(os.path.join(volume, f"research_task_{i}.txt"), 'w') as task_file:
+            task_file.write(f"prompt {i}")
+
+
+def test_replica_claims_only_free_workers(tmp_path):
+    volume = str(tmp_path)
+    write_tasks(volume, 10)
+    release = threading.Event()
+    started = []
+
+    def handler(task_id, prompt, result_path):
+        started.append(task_id)
+        release.wait(5)
+
+    first = TaskIntake(volume, handler, max_workers=2, claims=TaskClaims(volume, owner="a"))
+    second = TaskIntake(volume, handler, max_workers=2, claims=TaskClaims(volume, owner="b"))
+    try:
+        assert first.scan() == 2
+        assert first.scan() == 0
+        assert second.scan() == 2
+    finally:
+        release.set()
+        first.shutdown()
+        second.shutdown()
+    assert len(set(started)) == 4
+
+
+def test_failed_task_is_retried_then_given_up(tmp_path):
+    volume = str(tmp_path)
+    write_tasks(volume, 1)
+    calls = []
+
+    def handler(task_id, prompt, result_path):
+        calls.append(task_id)
+        raise RuntimeError("model unavailable")
+
+    claims = TaskClaims(volume)
+    intake = TaskIntake(volume, handler, max_workers=1, claims=claims, max_attempts=2, retry_delay=0)
+    try:
+        for _ in range(4):
+            intake.scan()
+            # The single worker runs this only after the task finished
+            intake._pool.submit(lambda: None).result()
+    finally:
+        intake.shutdown()
+
+    assert calls == ["0", "0"]
+    assert claims.failures("0")[0] == 2
+    assert claims.is_completed("0")
+    assert not os.path.exists(os.path.join(volume, ".claims", "0.lock"))
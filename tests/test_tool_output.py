@@ -0,0 +1,19 @@
+from utils.tool_output import render, truncate_text
+
+SUMMARY = "**Key idea**\n- uses X\n- beats Y\n\n```python\nmodel.fit()\n```"
+
+
+def test_truncate_text_keeps_lines_unless_cut():
+    assert truncate_text(SUMMARY, None) == SUMMARY
+    assert truncate_text(SUMMARY, 1000) == SUMMARY
+    assert truncate_text("one  two\nthree four", 12) == "one two..."
+
+
+def test_render_keeps_markdown_of_free_text():
+    assert render(SUMMARY, None) == SUMMARY
+    assert render({"readme_summary": SUMMARY}, None) == (
+        "readme_summary: **Key idea**\n  - uses X\n  - beats Y\n\n  ```python\n  model.fit()\n  ```")
+
+
+def test_render_short_records_inline():
+    assert render([{"title": "A", "authors": ["B", "C"]}]) == "- title: A; authors: B, C"
@@ -0,0 +1,37 @@
+import asyncio
+import json
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+
+from runner import TraceCallbackHandler
+from runner_tools import async_tool
+from utils.llm_cache import CompletionCache
+from utils.tracing import task_trace
+
+
+def test_summary_inside_a_tool_is_recorded_once(tmp_path):
+    model = FakeListChatModel(responses=["summary", "answer"])
+    cache = CompletionCache(str(tmp_path / "completions.sqlite"))
+
+    @async_tool
+    @tool
+    def summary_tool(link: str) -> str:
+        """Summarize a link."""
+        return cache.get_or_compute("fake-model", 0, "Summarize: ", link, lambda: model.invoke(link).content)
+
+    async def agent(link):
+        await summary_tool.ainvoke({"link": link})
+        return (await model.ainvoke(link)).content
+
+    with task_trace("0", str(tmp_path / "research_0.txt")) as trace:
+        asyncio.run(RunnableLambda(agent).ainvoke("https://arxiv.org/abs/2401.00001",
+                                                   config={"callbacks": [TraceCallbackHandler(trace)]}))
+
+    with open(trace.path) as f:
+        records = [json.loads(line) for line in f]
+    llm = [record for record in records if record["stage"] == "llm"]
+    # The summary is recorded by the completion cache, the handler records only the agent's own call
+    assert len(llm) == 2
+    assert [record["name"] for record in llm].count("fake-model") == 1
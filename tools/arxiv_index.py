@@ -0,0 +1,258 @@
+"""
+This module contains a local, incrementally updated arXiv index for offline semantic search.
+
+Paper metadata lives in a SQLite table and the embeddings in a flat float32 file that is
+memory-mapped for search, so a query costs one embedding call and one matmul.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from tools.arxiv_query_data_model import ArxivQuery, Paper
+from tools.arxiv_ranking import PaperRanker, normalize_rows
+from utils.pdf_parser import PDFParser
+from utils.storage import cache_dir, open_sqlite
+
+DATE_RANGE = re.compile(r'\[?\s*(\d{8})\d*\s+TO\s+(\d{8})\d*\s*\]?', re.IGNORECASE)
+
+
+class ArxivLocalIndex:
+    """
+    Append-only store of arXiv paper metadata and unit-length embeddings.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Initialize the index.
+        :param directory: Directory of the index, defaults to ARXIV_INDEX_DIR or the cache root
+        """
+        self.directory = directory or os.getenv("ARXIV_INDEX_DIR") or cache_dir("arxiv_index")
+        os.makedirs(self.directory, exist_ok=True)
+        self.vectors_path = os.path.join(self.directory, "embeddings.f32")
+
+        self._lock = threading.Lock()
+        self._db = open_sqlite(os.path.join(self.directory, "metadata.sqlite"))
+        self._db.execute("CREATE TABLE IF NOT EXISTS papers ("
+                         "row INTEGER PRIMARY KEY, arxiv_id TEXT UNIQUE NOT NULL, title TEXT NOT NULL,"
+                         " summary TEXT NOT NULL, link TEXT NOT NULL, authors TEXT NOT NULL, added_at REAL NOT NULL,"
+                         " categories TEXT NOT NULL DEFAULT '', published TEXT NOT NULL DEFAULT '')")
+        # Indexes built before the filters were stored get empty columns, their papers never match a filter
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(papers)")}
+        for column in ("categories", "published"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE papers ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+        self._db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._matrix = None
+        self._matrix_rows = -1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def _setting(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def model_name(self) -> Optional[str]:
+        """Name of the embedding model the index was built with."""
+        with self._lock:
+            return self._setting("model")
+
+    def known_ids(self, arxiv_ids: List[str]) -> set:
+        """
+        Find which papers are already indexed.
+        :param arxiv_ids: arXiv IDs to check
+        :return: Subset of the IDs that are in the index
+        """
+        with self._lock:
+            return {arxiv_id for arxiv_id in arxiv_ids
+                    if self._db.execute("SELECT 1 FROM papers WHERE arxiv_id = ?", (arxiv_id,)).fetchone()}
+
+    def add(self, papers: List[Paper], vectors, model_name: str) -> int:
+        """
+        Append papers and their embeddings, papers that are already indexed are skipped.
+        :param papers: Papers to add
+        :param vectors: Embeddings of the papers, one per row
+        :param model_name: Name of the embedding model
+        :return: Number of added papers
+        """
+        vectors = normalize_rows(vectors)
+        with self._lock:
+            stored_model = self._setting("model")
+            if stored_model is not None and stored_model != model_name:
+                raise ValueError(f"Index was built with {stored_model}, got embeddings from {model_name}")
+            stored_dim = self._setting("dim")
+            if stored_dim is not None and int(stored_dim) != vectors.shape[1]:
+                raise ValueError(f"Index stores {stored_dim}-dimensional embeddings, got {vectors.shape[1]}")
+
+            rows = self._db.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+            new_papers, new_vectors, seen = [], [], set()
+            for paper, vector in zip(papers, vectors):
+                arxiv_id = PDFParser.paper_id(paper.link) or paper.link
+                if arxiv_id in seen or self._db.execute("SELECT 1 FROM papers WHERE arxiv_id = ?",
+                                                        (arxiv_id,)).fetchone():
+                    continue
+                seen.add(arxiv_id)
+                new_papers.append((rows + len(new_papers), arxiv_id, paper))
+                new_vectors.append(vector)
+            if not new_papers:
+                return 0
+
+            # Vectors are written first; rows beyond the metadata count are cut off on the next write
+            row_bytes = vectors.shape[1] * 4
+            with open(self.vectors_path, 'ab') as vectors_file:
+                vectors_file.truncate(rows * row_bytes)
+                vectors_file.write(np.asarray(new_vectors, dtype=np.float32).tobytes())
+            now = time.time()
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO papers (row, arxiv_id, title, summary, link, authors, added_at, categories, published)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+                    (row, arxiv_id, paper.title, paper.summary, paper.link, json.dumps(paper.authors), now,
+                     ' '.join(paper.categories), paper.published or '')
+                    for row, arxiv_id, paper in new_papers])
+            self._db.execute("INSERT OR REPLACE INTO settings VALUES ('model', ?)", (model_name,))
+            self._db.execute("INSERT OR REPLACE INTO settings VALUES ('dim', ?)", (str(vectors.shape[1]),))
+            self._db.execute("COMMIT")
+            return len(new_papers)
+
+    def matrix(self) -> np.ndarray:
+        """
+        Memory-map the embedding matrix, it is remapped when the index grew.
+        :return: Read-only float32 matrix with one unit-length row per paper
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+            if rows != self._matrix_rows:
+                dim = int(self._setting("dim") or 0)
+                if rows == 0 or dim == 0:
+                    self._matrix = np.empty((0, dim), dtype=np.float32)
+                else:
+                    self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, dim))
+                self._matrix_rows = rows
+            return self._matrix
+
+    def papers(self, rows: List[int]) -> List[Paper]:
+        """
+        Load paper metadata.
+        :param rows: Row numbers in the embedding matrix
+        :return: Papers in the same order
+        """
+        papers = []
+        with self._lock:
+            for row in rows:
+                title, summary, link, authors, categories, published = self._db.execute(
+                    "SELECT title, summary, link, authors, categories, published FROM papers WHERE row = ?",
+                    (row,)).fetchone()
+                papers.append(Paper(title=title, summary=summary, link=link, authors=json.loads(authors),
+                                    categories=categories.split(), published=published or None,
+                                    semantic_score=0))
+        return papers
+
+    def filter_rows(self, query: ArxivQuery) -> Optional[List[int]]:
+        """
+        Find the papers that match the author, category and date filters of a query.
+        :param query: Search query
+        :return: Row numbers of the matching papers, None if the query has no filter
+        """
+        conditions, params = [], []
+        if query.author:
+            # Authors are stored as ASCII JSON, LIKE is case-insensitive for ASCII
+            conditions.append("authors LIKE ?")
+            params.append(f"%{json.dumps(query.author.strip())[1:-1]}%")
+        if query.category:
+            conditions.append("(' ' || categories || ' ') LIKE ?")
+            params.append(f"% {query.category.strip()} %")
+        if query.date_range:
+            match = DATE_RANGE.search(query.date_range)
+            if match:
+                # Dates are stored as YYYY-MM-DD
+                conditions.append("published BETWEEN ? AND ?")
+                params.extend(f"{day[:4]}-{day[4:6]}-{day[6:]}" for day in match.groups())
+            else:
+                print(f"Ignoring date range {query.date_range}, expected [YYYYMMDD TO YYYYMMDD]")
+        if not conditions:
+            return None
+        with self._lock:
+            return [row for row, in self._db.execute(
+                f"SELECT row FROM papers WHERE {' AND '.join(conditions)} ORDER BY row", params)]
+
+    def search(self, query_vectors, max_results: int = 5, similarity_threshold: float = 0.5,
+               rows: Optional[List[int]] = None) -> List[List[Paper]]:
+        """
+        Rank the whole index, or some of its papers, for several queries.
+        :param query_vectors: Query embeddings, one per row
+        :param max_results: Maximum number of results per query
+        :param similarity_threshold: Minimum cosine similarity to return results
+        :param rows: Only rank these papers, e.g. the result of filter_rows
+        :return: For every query the relevant papers sorted by semantic similarity
+        """
+        matrix = self.matrix()
+        if rows is not None:
+            matrix = np.asarray(matrix[rows])
+        ranker = PaperRanker(matrix, normalized=True)
+        results = []
+        for hits in ranker.top_k(query_vectors, max_results, similarity_threshold):
+            if rows is not None:
+                hits = [(rows[index], score) for index, score in hits]
+            papers = self.papers([row for row, _ in hits])
+            results.append([paper.model_copy(update={"semantic_score": score})
+                            for paper, (_, score) in zip(papers, hits)])
+        return results
+
+    def ingest(self, searcher, query: ArxivQuery) -> int:
+        """
+        Fetch the newest papers for a query and add the ones that are not indexed yet.
+        :param searcher: ArXivSemanticSearch used to query arXiv and embed papers
+        :param query: Query describing the papers to ingest, e.g. a category
+        :return: Number of added papers
+        """
+        papers, _ = searcher.search_arxiv(query, sort_by="submittedDate")
+        known = self.known_ids([PDFParser.paper_id(paper.link) or paper.link for paper in papers])
+        new_papers = [paper for paper in papers if (PDFParser.paper_id(paper.link) or paper.link) not in known]
+        if not new_papers:
+            return 0
+        vectors = searcher.generate_embeddings(new_papers)
+        model_name = getattr(searcher.model, "model", type(searcher.model).__name__)
+        return self.add(new_papers, vectors, model_name)
+
+
+_arxiv_index = None
+_arxiv_index_lock = threading.Lock()
+
+
+def get_arxiv_index() -> ArxivLocalIndex:
+    """Return the process-wide local arXiv index."""
+    global _arxiv_index
+    with _arxiv_index_lock:
+        if _arxiv_index is None:
+            _arxiv_index = ArxivLocalIndex()
+        return _arxiv_index
+
+
+if __name__ == "__main__":
+    # Daily update, e.g. python -m tools.arxiv_index --category cs.LG --category cs.CL
+    from tools.arxiv_search import ArXivSemanticSearch
+    from utils.clients import get_embeddings
+
+    parser = argparse.ArgumentParser(description="Add the newest arXiv papers to the local index")
+    parser.add_argument("--category", action="append", default=[], help="arXiv category, e.g. cs.LG")
+    parser.add_argument("--query", action="append", default=[], help="Phrase searched in title and abstract")
+    parser.add_argument("--max-papers", type=int, default=1000, help="Papers fetched per category or query")
+    args = parser.parse_args()
+
+    embeddings = get_embeddings("text-embedding-ada-002", chunk_size=1000)
+    arxiv_search = ArXivSemanticSearch(embeddings, max_papers=args.max_papers)
+    index = ArxivLocalIndex()
+    queries = ([ArxivQuery(category=category) for category in args.category]
+               + [ArxivQuery(all_fields=phrase) for phrase in args.query])
+    for ingest_query in queries:
+        added = index.ingest(arxiv_search, ingest_query)
+        print(f"{ingest_query.model_dump(exclude_none=True)}: added {added} papers, index has {len(index)}")
@@ -0,0 +1,63 @@
+"""
+This module contains an in-process BM25 index used to pre-filter arXiv candidates before embedding.
+"""
+import math
+import re
+from collections import Counter
+from typing import List
+
+import numpy as np
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+# arXiv query syntax that must not count as search terms
+QUERY_SYNTAX = {'ti', 'abs', 'au', 'cat', 'all', 'and', 'or', 'andnot', 'submitteddate', 'to'}
+STOPWORDS = {'a', 'an', 'the', 'of', 'for', 'in', 'on', 'with', 'to', 'and', 'or', 'by', 'is', 'are', 'we',
+             'this', 'that', 'from', 'as', 'at', 'be', 'our', 'it', 'its', 'using', 'via'}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase terms without stopwords.
+    :param text: Text to split
+    :return: List of terms
+    """
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a small in-memory collection, e.g. the titles and abstracts of one arXiv result set.
+    """
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        """
+        Build the index.
+        :param documents: Texts to index
+        :param k1: Term frequency saturation
+        :param b: Document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(document)) for document in documents]
+        self.lengths = np.array([sum(counts.values()) for counts in self.term_counts], dtype=np.float32)
+        self.average_length = float(self.lengths.mean()) if len(documents) else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        total = len(documents)
+        self.idf = {term: math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+                    for term, frequency in document_frequency.items()}
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Score every document against a query.
+        :param query: Query text, arXiv query syntax is ignored
+        :return: BM25 score per document
+        """
+        terms = [term for term in set(tokenize(query)) if term not in QUERY_SYNTAX and term in self.idf]
+        scores = np.zeros(len(self.term_counts), dtype=np.float32)
+        if not terms or self.average_length == 0:
+            return scores
+        length_norm = self.k1 * (1 - self.b + self.b * self.lengths / self.average_length)
+        for term in terms:
+            frequencies = np.array([counts.get(term, 0) for counts in self.term_counts], dtype=np.float32)
+            scores += self.idf[term] * frequencies * (self.k1 + 1) / (frequencies + length_norm)
+        return scores
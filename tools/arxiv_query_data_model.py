@@ -51,3 +51,5 @@ class Paper(BaseModel):
     summary: str
     link: str
     authors: list[str]
+    categories: list[str] = []
+    published: Optional[str] = None
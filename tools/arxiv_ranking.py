@@ -0,0 +1,62 @@
+"""
+This module contains a NumPy ranking engine for semantic search over paper embeddings.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+
+def normalize_rows(matrix) -> np.ndarray:
+    """
+    Scale every row to unit length so a dot product equals the cosine similarity.
+    :param matrix: Vectors, one per row
+    :return: float32 matrix with unit rows, zero rows stay zero
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+class PaperRanker:
+    """
+    Scores queries against a pre-normalized float32 matrix of paper embeddings with one matmul.
+    """
+
+    def __init__(self, paper_vectors, normalized: bool = False):
+        """
+        Initialize the ranker.
+        :param paper_vectors: Paper embeddings, one per row
+        :param normalized: Set if the rows already have unit length, e.g. a memory-mapped index
+        """
+        self.matrix = paper_vectors if normalized else normalize_rows(paper_vectors)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def score(self, query_vectors) -> np.ndarray:
+        """
+        Compute cosine similarities of queries and papers.
+        :param query_vectors: Query embeddings, one per row
+        :return: Matrix with one row per query and one column per paper
+        """
+        return normalize_rows(query_vectors) @ self.matrix.T
+
+    def top_k(self, query_vectors, k: int, threshold: float = -1.0) -> List[List[Tuple[int, float]]]:
+        """
+        Find the best papers for each query.
+        :param query_vectors: Query embeddings, one per row
+        :param k: Maximum number of papers per query
+        :param threshold: Minimum cosine similarity
+        :return: For every query a list of (paper index, similarity), best first
+        """
+        if len(self) == 0:
+            return [[] for _ in np.atleast_2d(query_vectors)]
+        results = []
+        for scores in self.score(query_vectors):
+            candidates = np.flatnonzero(scores >= threshold)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+            best = candidates[np.argsort(scores[candidates])[::-1]]
+            results.append([(int(index), float(scores[index])) for index in best])
+        return results
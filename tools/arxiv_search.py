@@ -1,35 +1,52 @@
 """
 This module provides a class for performing semantic search on arXiv papers using a sentence transformer model.
 """
+import os
 import xml.etree.ElementTree as et
+from typing import Iterator, Optional
 
-import requests
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 
+from tools.arxiv_lexical import BM25Index
 from tools.arxiv_query_data_model import ArxivQuery, Paper
+from tools.arxiv_ranking import PaperRanker
+from utils.embedding_cache import get_embedding_cache
+from utils.http_cache import download_to_file
+from utils.pdf_parser import PDFParser
+
+ARXIV_PAGE_SIZE = int(os.getenv("ARXIV_PAGE_SIZE", "100"))
+ATOM = '{http://www.w3.org/2005/Atom}'
 
 
 class ArXivSemanticSearch:
     """
     Class for performing semantic search on arXiv papers using a sentence transformer model.
     """
-    def __init__(self, embedding_model, max_papers=1000):
+    def __init__(self, embedding_model, max_papers=1000, index=None, retrieval: str = "semantic",
+                 lexical_top_n: int = 100, lexical_weight: float = 0.3):
         """
         Initialize the ArXiv Semantic Search with a sentence transformer model.
         :param embedding_model: model to use for embeddings
         :param max_papers: Maximum number of papers to retrieve from arXiv
+        :param index: Optional ArxivLocalIndex, when it is not empty searches run on it without calling arXiv
+        :param retrieval: "semantic" embeds every candidate, "hybrid" embeds only the BM25 top candidates
+        :param lexical_top_n: Number of BM25 candidates embedded in hybrid mode
+        :param lexical_weight: Share of the normalized BM25 score in the hybrid ranking score
         """
         self.model = embedding_model
         self.max_papers = max_papers
+        self.index = index
+        self.retrieval = retrieval
+        self.lexical_top_n = lexical_top_n
+        self.lexical_weight = lexical_weight
 
-    def search_arxiv(self, query: ArxivQuery) -> tuple[list[Paper], str]:
+    @staticmethod
+    def build_search_query(query: ArxivQuery) -> str:
         """
-        Search arXiv.org for papers and retrieve metadata
-        :param query: Search query string
-        :return: List of paper dictionaries
+        Build the arXiv API search query
+        :param query: Search query
+        :return: Query string for the search_query parameter
         """
-        base_url = 'http://export.arxiv.org/api/query?'
-
         # Build query string from ArxivQuery object
         query_parts = []
         if query.all_fields:
@@ -46,64 +63,210 @@ class ArXivSemanticSearch:
             query_parts.append(f'submittedDate:{query.date_range}')
 
         # Join query parts with AND
-        search_query = ' AND '.join(query_parts) if query_parts else 'all:*'
-        url = f"{base_url}search_query={search_query}&start=0&max_results={self.max_papers}"
+        return ' AND '.join(query_parts) if query_parts else 'all:*'
 
-        response = requests.get(url)
-        root = et.fromstring(response.content)
+    @classmethod
+    def topic(cls, query: ArxivQuery) -> str:
+        """
+        Text of a query without its author, category and date filters
+        :param query: Search query
+        :return: Phrase and title, the full search query if neither is set
+        """
+        return ' '.join(filter(None, [query.all_fields, query.title])) or cls.build_search_query(query)
 
-        papers = []
-        namespace = {'atom': 'http://www.w3.org/2005/Atom', 'arxiv': 'http://arxiv.org/schemas/atom'}
+    @staticmethod
+    def _parse_entry(entry: et.Element) -> Optional[Paper]:
+        """
+        Convert an Atom entry into a Paper
+        :param entry: Parsed <entry> element
+        :return: Paper, None for entries without a PDF link such as API error entries
+        """
+        pdf_link = entry.find(f'{ATOM}link[@title="pdf"]')
+        if pdf_link is None:
+            return None
+        published = entry.find(f'{ATOM}published')
+        return Paper(
+            title=entry.find(f'{ATOM}title').text.strip(),
+            summary=entry.find(f'{ATOM}summary').text.strip(),
+            semantic_score=0,
+            link=pdf_link.get('href'),
+            authors=[
+                author.find(f'{ATOM}name').text
+                for author in entry.findall(f'{ATOM}author')
+            ],
+            categories=[category.get('term') for category in entry.findall(f'{ATOM}category')
+                        if category.get('term')],
+            published=published.text[:10] if published is not None and published.text else None
+        )
 
-        for entry in root.findall('atom:entry', namespace):
-            paper = Paper(
-                title=entry.find('atom:title', namespace).text.strip(),
-                summary=entry.find('atom:summary', namespace).text.strip(),
-                semantic_score=0,
-                link=entry.find('atom:link[@title="pdf"]', namespace).get('href'),
-                authors=[
-                    author.find('atom:name', namespace).text
-                    for author in entry.findall('atom:author', namespace)
-                ]
-            )
-            papers.append(paper)
+    def iter_paper_pages(self, query: ArxivQuery, sort_by: str = None,
+                         page_size: int = ARXIV_PAGE_SIZE) -> Iterator[list[Paper]]:
+        """
+        Page through arXiv search results, every page is streamed to disk and parsed entry by entry
+        :param query: Search query
+        :param sort_by: Optional arXiv sort field, e.g. submittedDate for the newest papers first
+        :param page_size: Number of results requested per API call
+        :return: Generator of result pages, stops after max_papers results or the last page
+        """
+        base_url = 'http://export.arxiv.org/api/query?'
+        search_query = self.build_search_query(query)
+        for start in range(0, self.max_papers, page_size):
+            count = min(page_size, self.max_papers - start)
+            url = f"{base_url}search_query={search_query}&start={start}&max_results={count}"
+            if sort_by:
+                url += f"&sortBy={sort_by}&sortOrder=descending"
+
+            page, entries = [], 0
+            # Pages that are not cached are spaced by the HTTP client, see HOST_REQUEST_INTERVALS
+            with download_to_file(url) as feed_path:
+                for _, element in et.iterparse(feed_path, events=('end',)):
+                    if element.tag != f'{ATOM}entry':
+                        continue
+                    entries += 1
+                    paper = self._parse_entry(element)
+                    element.clear()
+                    if paper is not None:
+                        page.append(paper)
+            if page:
+                yield page
+            if entries < count:
+                return
 
-        return papers, search_query
+    def iter_papers(self, query: ArxivQuery, sort_by: str = None) -> Iterator[Paper]:
+        """
+        Yield arXiv search results one by one, the next page is only requested when it is needed
+        :param query: Search query
+        :param sort_by: Optional arXiv sort field, e.g. submittedDate for the newest papers first
+        :return: Generator of papers
+        """
+        for page in self.iter_paper_pages(query, sort_by):
+            yield from page
 
-    def generate_embeddings(self, papers) -> list:
+    def search_arxiv(self, query: ArxivQuery, sort_by: str = None) -> tuple[list[Paper], str]:
         """
-        Generate embeddings for paper titles and summaries
+        Search arXiv.org for papers and retrieve metadata
+        :param query: Search query string
+        :param sort_by: Optional arXiv sort field, e.g. submittedDate for the newest papers first
+        :return: List of paper dictionaries
+        """
+        return list(self.iter_papers(query, sort_by)), self.build_search_query(query)
+
+    def generate_embeddings(self, papers) -> np.ndarray:
+        """
+        Generate embeddings for paper titles and summaries, papers embedded before are read from the cache
         :param papers: List of paper dictionaries
-        :return: List of embeddings
+        :return: float32 matrix with one embedding per row
         """
         texts = [f"{paper.title} {paper.summary}" for paper in papers]
-        return self.model.embed_documents(texts)
+        doc_ids = [PDFParser.paper_id(paper.link) or paper.link for paper in papers]
+        return get_embedding_cache().embed_documents(self.model, doc_ids, texts)
+
+    def embed_queries(self, query_strings: list[str]) -> np.ndarray:
+        """
+        Generate embeddings of search queries
+        :param query_strings: arXiv search query strings
+        :return: float32 matrix with one embedding per row
+        """
+        doc_ids = [f"query:{query_string}" for query_string in query_strings]
+        return get_embedding_cache().embed_documents(self.model, doc_ids, query_strings)
+
+    def rank_papers(self, papers: list[Paper], query_strings: list[str], max_results: int = 5,
+                    similarity_threshold: float = 0.5) -> list[list[Paper]]:
+        """
+        Rank one list of papers for several queries in one batch
+        :param papers: Candidate papers
+        :param query_strings: Search queries
+        :param max_results: Maximum number of results per query
+        :param similarity_threshold: Minimum cosine similarity to return results
+        :return: For every query the relevant papers sorted by semantic similarity
+        """
+        ranker = PaperRanker(self.generate_embeddings(papers))
+        hits = ranker.top_k(self.embed_queries(query_strings), max_results, similarity_threshold)
+        return [[papers[index].model_copy(update={"semantic_score": score}) for index, score in query_hits]
+                for query_hits in hits]
 
-    def semantic_search(self, query: ArxivQuery, max_results: int = 5, similarity_threshold: float = 0.5) -> list:
+    def semantic_search(self, query: ArxivQuery, max_results: int = 5, similarity_threshold: float = 0.5,
+                        min_candidates: int = None) -> list:
         """
         Perform semantic search on arXiv papers
 
         :param query: Search query string
         :param max_results: Maximum number of results to retrieve
         :param similarity_threshold: Minimum cosine similarity to return results
+        :param min_candidates: Stop fetching pages once this many papers passed the threshold,
+            None ranks up to max_papers results
         :return: List of relevant papers sorted by semantic similarity
         """
-        # Search arXiv for papers
-        papers, query_string = self.search_arxiv(query)[0], self.search_arxiv(query)[1]
+        if self.index is not None and len(self.index) > 0:
+            papers = self.search_local(query, max_results, similarity_threshold)
+            if papers is not None:
+                return papers
 
-        # Generate embeddings
-        paper_embeddings = self.generate_embeddings(papers)
-        query_embedding = self.model.embed_documents([query_string])[0]
+        query_embedding = self.embed_queries([self.build_search_query(query)])
+        if self.retrieval == "hybrid":
+            # BM25 needs the whole candidate set, it is fetched in one request and min_candidates does not apply
+            papers = [paper for page in self.iter_paper_pages(query, page_size=self.max_papers) for paper in page]
+            return self.hybrid_rank(papers, query, query_embedding, max_results, similarity_threshold)
 
-        # Calculate cosine similarities
-        similarities = cosine_similarity([query_embedding], paper_embeddings)[0]
+        # Rank every page as it arrives, the global top results are among the top results of the pages
+        relevant_papers, candidates = [], 0
+        for page in self.iter_paper_pages(query):
+            ranker = PaperRanker(self.generate_embeddings(page))
+            page_hits = ranker.top_k(query_embedding, len(page), similarity_threshold)[0]
+            candidates += len(page_hits)
+            relevant_papers.extend(page[index].model_copy(update={"semantic_score": score})
+                                   for index, score in page_hits[:max_results])
+            if min_candidates is not None and candidates >= min_candidates:
+                break
 
-        # Filter and sort results
-        relevant_papers = []
-        for i, similarity in enumerate(similarities):
-            if similarity >= similarity_threshold:
-                papers[i].semantic_score = similarity
-                relevant_papers.append(papers[i])
-
-        # Sort by semantic similarity in descending order
         return sorted(relevant_papers, key=lambda x: x.semantic_score, reverse=True)[:max_results]
+
+    def hybrid_rank(self, papers: list[Paper], query: ArxivQuery, query_embedding: np.ndarray,
+                    max_results: int = 5, similarity_threshold: float = 0.5) -> list[Paper]:
+        """
+        Pre-filter papers with BM25, embed only the lexical top candidates and rank them by a blend
+        of the semantic and the normalized lexical score
+
+        :param papers: Candidate papers
+        :param query: Search query
+        :param query_embedding: Embedding of the search query, one row
+        :param max_results: Maximum number of results to retrieve
+        :param similarity_threshold: Minimum cosine similarity to return results
+        :return: List of relevant papers sorted by hybrid score, stored in semantic_score
+        """
+        if not papers:
+            return []
+        lexical_query = self.topic(query)
+        lexical = BM25Index([f"{paper.title} {paper.summary}" for paper in papers]).scores(lexical_query)
+
+        top_n = min(self.lexical_top_n, len(papers))
+        candidates = np.argpartition(lexical, -top_n)[-top_n:]
+        candidate_papers = [papers[index] for index in candidates]
+
+        semantic = PaperRanker(self.generate_embeddings(candidate_papers)).score(query_embedding)[0]
+        lexical_max = float(lexical[candidates].max())
+        lexical_norm = lexical[candidates] / lexical_max if lexical_max > 0 else np.zeros(top_n, dtype=np.float32)
+        combined = (1 - self.lexical_weight) * semantic + self.lexical_weight * lexical_norm
+
+        ranked = [i for i in np.argsort(combined)[::-1] if semantic[i] >= similarity_threshold][:max_results]
+        return [candidate_papers[i].model_copy(update={"semantic_score": float(combined[i])}) for i in ranked]
+
+    def search_local(self, query: ArxivQuery, max_results: int = 5, similarity_threshold: float = 0.5) -> list:
+        """
+        Perform semantic search on the local index, without calling the arXiv API.
+        Author, category and date filters select the indexed papers that are ranked
+
+        :param query: Search query string
+        :param max_results: Maximum number of results to retrieve
+        :param similarity_threshold: Minimum cosine similarity to return results
+        :return: List of relevant papers sorted by semantic similarity,
+            None if no indexed paper matches the filters and the arXiv API has to be searched
+        """
+        model_name = getattr(self.model, "model", type(self.model).__name__)
+        if self.index.model_name != model_name:
+            raise ValueError(f"Local index was built with {self.index.model_name}, not {model_name}")
+        rows = self.index.filter_rows(query)
+        if rows is not None and not rows:
+            return None
+        query_embedding = self.embed_queries([self.topic(query)])
+        return self.index.search(query_embedding, max_results, similarity_threshold, rows=rows)[0]
@@ -1,8 +1,29 @@
-import requests
-import time
-from typing import List, Dict, Any
-
-from tools.utils_text_summary_tools import Summarizer
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+from tools.github_client import README_NOT_AVAILABLE, get_github_client
+from tools.utils_text_summary_tools import SUMMARY_CONCURRENCY, Summarizer
+from utils.tokens import count_tokens, split_text_by_tokens
+from utils.tracing import propagate
+
+# Tokens of source code sent to the model per repository, and per file
+CODE_TOKEN_BUDGET = int(os.getenv("GITHUB_CODE_TOKEN_BUDGET", "40000"))
+CODE_FILE_TOKENS = int(os.getenv("GITHUB_CODE_FILE_TOKENS", "8000"))
+# Files below PACK_FILE_TOKENS share one request of up to PACK_TOKENS tokens
+PACK_FILE_TOKENS = 1500
+PACK_TOKENS = 6000
+BYTES_PER_TOKEN = 4
+# Larger files are usually generated or embedded data and are skipped
+MAX_CODE_FILE_BYTES = 200_000
+CODE_EXTENSIONS = ('.py',)
+SKIP_DIRS = {'.git', '.github', 'venv', '.venv', 'env', 'site-packages', 'node_modules', 'build', 'dist',
+             'vendor', 'third_party', 'migrations', '__pycache__'}
+LOW_RELEVANCE_DIRS = {'test', 'tests', 'testing', 'docs', 'doc', 'examples', 'example', 'scripts', 'benchmarks'}
+KEY_NAMES = {'main', 'model', 'models', 'train', 'training', 'inference', 'predict', 'pipeline', 'app', 'run',
+             'api', 'core', 'cli', 'server', 'trainer', 'modeling'}
+GENERATED_SUFFIXES = ('_pb2.py', '_pb2_grpc.py')
 
 
 def get_repo_readme(owner: str, repo: str) -> str:
@@ -16,12 +37,7 @@ def get_repo_readme(owner: str, repo: str) -> str:
     Returns:
         str: The content of the README file.
     """
-    url = f'https://api.github.com/repos/{owner}/{repo}/readme'
-    headers = {'Accept': 'application/vnd.github.v3.raw'}
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.text
-    return "README not available"
+    return get_github_client().get_readme(owner, repo)
 
 def get_repo_files(owner: str, repo: str) -> List[Dict[str, Any]]:
     """
@@ -34,8 +50,7 @@ def get_repo_files(owner: str, repo: str) -> List[Dict[str, Any]]:
     Returns:
         List[Dict[str, Any]]: A list of dictionaries containing file information.
     """
-    url = f'https://api.github.com/repos/{owner}/{repo}/contents'
-    response = requests.get(url)
+    response = get_github_client().get(f'/repos/{owner}/{repo}/contents')
     response.raise_for_status()
     return response.json()
 
@@ -51,9 +66,8 @@ def get_file_content(owner: str, repo: str, path: str) -> str:
     Returns:
         str: The content of the file.
     """
-    url = f'https://api.github.com/repos/{owner}/{repo}/contents/{path}'
     headers = {'Accept': 'application/vnd.github.v3.raw'}
-    response = requests.get(url, headers=headers)
+    response = get_github_client().get(f'/repos/{owner}/{repo}/contents/{path}', headers=headers)
     response.raise_for_status()
     return response.text
 
@@ -72,29 +86,18 @@ def search_github_repos(key_words: List[str], paper_name: str, top_k: int = 5, m
     Returns:
         List[Dict[str, Any]]: A list of dictionaries containing information about the top repositories.
     """
+    client = get_github_client()
     all_repos = []
 
-    # Perform search for the paper name if it is not None or empty
-    paper_repos = []
-    if paper_name and paper_name.strip():
-        paper_query = f'"{paper_name}"'
-        paper_url = f'https://api.github.com/search/repositories?q={paper_query}'
-        paper_response = requests.get(paper_url)
-        paper_response.raise_for_status()
-        paper_data = paper_response.json()
-        paper_repos = paper_data['items'][:min_paper_repos]
-        # print(f"repos names for papers: {[repo['full_name'] for repo in paper_repos]}")
-
-    # Perform separate searches for each keyword
+    # Search for the paper name (if it is not None or empty) and every keyword concurrently
+    has_paper = bool(paper_name and paper_name.strip())
+    queries = ([f'"{paper_name}"'] if has_paper else []) + [f'"{term}"' for term in key_words]
+    results = client.search_many(queries)
+
+    paper_repos = results[0][:min_paper_repos] if has_paper else []
     keyword_repos = []
-    for term in key_words:
-        query = f'"{term}"'
-        url = f'https://api.github.com/search/repositories?q={query}'
-        time.sleep(0.5)  # Rate limiting
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        keyword_repos.extend(data['items'][:1])  # Take at least one repo for each keyword
+    for items in results[int(has_paper):]:
+        keyword_repos.extend(items[:1])  # Take at least one repo for each keyword
 
     # Remove duplicates by repository full name (owner/repo)
     unique_repos = {repo['full_name']: repo for repo in all_repos + keyword_repos}.values()
@@ -107,12 +110,13 @@ def search_github_repos(key_words: List[str], paper_name: str, top_k: int = 5, m
     top_repos = sorted_repos[:top_k - len(paper_repos)]
     top_repos.extend(paper_repos)
 
-    # Extract relevant information and README content
+    # Extract relevant information and README content, READMEs are fetched in one batch
+    readmes = client.fetch_readmes([repo['full_name'] for repo in top_repos])
     repo_info = []
     for repo in top_repos:
         owner = repo['owner']['login']
         repo_name = repo['name']
-        readme = get_repo_readme(owner, repo_name)
+        readme = readmes[repo['full_name']]
         repo_info.append({
             'owner': owner,
             'name': repo_name,
@@ -125,7 +129,131 @@ def search_github_repos(key_words: List[str], paper_name: str, top_k: int = 5, m
 
     return repo_info
 
-def summarize_repository(owner: str, repo: str, include_files: bool = True) -> Dict[str, Any]:
+def code_file_relevance(path: str) -> Optional[int]:
+    """
+    Score how much a file tells about what a repository does.
+
+    Args:
+        path (str): Path of the file in the repository.
+
+    Returns:
+        Optional[int]: Relevance score, higher is more relevant. None for files that should never be analyzed.
+    """
+    directories = path.split('/')[:-1]
+    name = posixpath.basename(path)
+    stem = posixpath.splitext(name)[0]
+    if not name.endswith(CODE_EXTENSIONS) or name.endswith(GENERATED_SUFFIXES):
+        return None
+    if any(directory in SKIP_DIRS or directory.endswith('.egg-info') for directory in directories):
+        return None
+
+    score = 10 - len(directories)
+    if stem in KEY_NAMES:
+        score += 3
+    if stem == '__init__' or stem == 'setup':
+        score -= 2
+    if any(directory in LOW_RELEVANCE_DIRS for directory in directories) or stem.startswith('test_'):
+        score -= 5
+    return score
+
+
+def select_code_files(tree: List[Dict[str, Any]], token_budget: int = CODE_TOKEN_BUDGET,
+                      file_tokens: int = CODE_FILE_TOKENS) -> List[Dict[str, Any]]:
+    """
+    Pick the most relevant code files whose estimated size fits into the token budget.
+
+    Args:
+        tree (List[Dict[str, Any]]): Blob entries of the git trees API.
+        token_budget (int): Maximum estimated tokens of all selected files.
+        file_tokens (int): Files larger than this are only analyzed up to this many tokens.
+
+    Returns:
+        List[Dict[str, Any]]: Selected entries, most relevant first.
+    """
+    scored = [(code_file_relevance(entry['path']), entry) for entry in tree
+              if 0 < entry.get('size', 0) <= MAX_CODE_FILE_BYTES]
+    scored = sorted([(score, entry) for score, entry in scored if score is not None],
+                    key=lambda item: (-item[0], item[1]['path']))
+
+    selected, used = [], 0
+    for _, entry in scored:
+        tokens = min(entry['size'] // BYTES_PER_TOKEN + 1, file_tokens)
+        if used + tokens > token_budget:
+            continue
+        selected.append(entry)
+        used += tokens
+    return selected
+
+
+def pack_code_files(files: Dict[str, str], pack_file_tokens: int = PACK_FILE_TOKENS,
+                    pack_tokens: int = PACK_TOKENS) -> List[List[str]]:
+    """
+    Group small files so that they share one summarization request, larger files stay alone.
+
+    Args:
+        files (Dict[str, str]): File content by path.
+        pack_file_tokens (int): Files below this many tokens are packed.
+        pack_tokens (int): Maximum tokens of one pack.
+
+    Returns:
+        List[List[str]]: Groups of paths, one request each.
+    """
+    groups, pack, pack_size = [], [], 0
+    for path, content in files.items():
+        tokens = count_tokens(content)
+        if tokens >= pack_file_tokens:
+            groups.append([path])
+            continue
+        if pack and pack_size + tokens > pack_tokens:
+            groups.append(pack)
+            pack, pack_size = [], 0
+        pack.append(path)
+        pack_size += tokens
+    if pack:
+        groups.append(pack)
+    return groups
+
+
+def summarize_code(owner: str, repo: str, token_budget: int = CODE_TOKEN_BUDGET,
+                   max_workers: int = SUMMARY_CONCURRENCY) -> Dict[str, str]:
+    """
+    Explain the most relevant code files of a repository within a token budget.
+
+    Args:
+        owner (str): The owner of the repository.
+        repo (str): The name of the repository.
+        token_budget (int): Maximum tokens of code sent to the model. Default is GITHUB_CODE_TOKEN_BUDGET.
+        max_workers (int): Maximum number of concurrent downloads and model calls.
+
+    Returns:
+        Dict[str, str]: Summary by file path, packed files share one entry keyed by their joined paths.
+    """
+    selected = select_code_files(get_github_client().get_tree(owner, repo), token_budget)
+    if not selected:
+        return {}
+
+    def download(entry: Dict[str, Any]) -> str:
+        content = get_file_content(owner, repo, entry['path'])
+        if count_tokens(content) > CODE_FILE_TOKENS:
+            content = split_text_by_tokens(content, CODE_FILE_TOKENS)[0]
+        return content
+
+    single, packed = Summarizer("code"), Summarizer("code_files")
+
+    def summarize(group: List[str]) -> str:
+        if len(group) == 1:
+            return single.summarize_text(files[group[0]])
+        return packed.summarize_text("\n\n".join(f"# File: {path}\n{files[path]}" for path in group))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        files = dict(zip([entry['path'] for entry in selected], pool.map(propagate(download), selected)))
+        groups = pack_code_files(files)
+        summaries = list(pool.map(propagate(summarize), groups))
+    return {', '.join(group): summary for group, summary in zip(groups, summaries)}
+
+
+def summarize_repository(owner: str, repo: str, include_files: bool = True,
+                         readme: Optional[str] = None) -> Dict[str, Any]:
     """
     Summarize the given repository, including README and optionally code analysis.
 
@@ -133,34 +261,28 @@ def summarize_repository(owner: str, repo: str, include_files: bool = True) -> D
         owner (str): The owner of the repository.
         repo (str): The name of the repository.
         include_files (bool): Whether to include code analysis. Default is True.
+        readme (Optional[str]): README content if it was already fetched. Default is None.
 
     Returns:
         Dict[str, Any]: A dictionary containing the summaries of the README and optionally code analysis.
     """
     # Get README content
-    readme = get_repo_readme(owner, repo)
-    if readme == "README not available":
-        return {'readme_summary': "README not available"}
+    if readme is None:
+        readme = get_repo_readme(owner, repo)
+    if readme == README_NOT_AVAILABLE:
+        return {'readme_summary': README_NOT_AVAILABLE}
     s = Summarizer("text")
-    readme_summary = s.summarize_text(readme)
-
-    result = {
-        'readme_summary': readme_summary,
-    }
-
-    if include_files:
-        # Get repository files
-        files = get_repo_files(owner, repo)
-        code_summaries = {}
-        s = Summarizer("code")
-        for file in files:
-            if file['type'] == 'file' and file['name'].endswith('.py'):  # Assuming Python files for code analysis
-                file_content = get_file_content(owner, repo, file['path'])
-                code_summary = s.summarize_text(file_content)
-                code_summaries[file['name']] = code_summary
-        result['code_summaries'] = code_summaries
+    if not include_files:
+        return {'readme_summary': s.summarize_text(readme)}
 
-    return result
+    # The README summary runs while the code is analyzed
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        readme_future = pool.submit(propagate(s.summarize_text), readme)
+        code_summaries = summarize_code(owner, repo)
+        return {
+            'readme_summary': readme_future.result(),
+            'code_summaries': code_summaries,
+        }
 
 
 def search_and_summary_gh_repos(key_words: List[str], paper_name: str, top_k: int = 5, min_stars: int = 10, min_paper_repos: int = 3) -> Dict[str, Any]:
@@ -182,7 +304,7 @@ def search_and_summary_gh_repos(key_words: List[str], paper_name: str, top_k: in
     for repo in repos:
         owner = repo['owner']
         repo_name = repo['name']
-        summary = summarize_repository(owner, repo_name, include_files=False)
+        summary = summarize_repository(owner, repo_name, include_files=False, readme=repo['readme'])
         summaries.append({
             'repository': repo,
             'summary': summary
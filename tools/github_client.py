@@ -0,0 +1,239 @@
+"""
+This module contains a rate-limit-aware GitHub client.
+
+REST calls go through the shared HTTP cache, so unchanged resources are revalidated with their ETag.
+The client reads the X-RateLimit headers of every response and spaces out requests when the remaining
+budget of a resource runs low. With a GITHUB_TOKEN it fetches READMEs of many repositories in batched
+GraphQL queries, without one it falls back to concurrent REST calls.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from utils.http_cache import cached_get
+from utils.http_client import http_post
+from utils.tracing import propagate
+
+GITHUB_API = "https://api.github.com"
+GITHUB_GRAPHQL = "https://api.github.com/graphql"
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN") or None
+GITHUB_CONCURRENCY = int(os.getenv("GITHUB_CONCURRENCY", "4"))
+# Requests left in a window below which the client starts spacing out calls
+GITHUB_RATE_RESERVE = 10
+GITHUB_MAX_WAIT = 60.0
+GRAPHQL_BATCH_SIZE = 20
+README_NOT_AVAILABLE = "README not available"
+README_EXPRESSIONS = ("HEAD:README.md", "HEAD:README.rst", "HEAD:README", "HEAD:readme.md")
+
+
+class GitHubClient:
+    """
+    GitHub REST and GraphQL client with adaptive throttling.
+    """
+
+    def __init__(self, token: Optional[str] = GITHUB_TOKEN, max_workers: int = GITHUB_CONCURRENCY):
+        """
+        Initialize the client.
+        :param token: Optional personal access token, raises the rate limits and enables GraphQL
+        :param max_workers: Number of concurrent requests for batched lookups
+        """
+        self.token = token
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        # Rate limit resource (core, search, graphql) -> (remaining requests, reset epoch)
+        self._limits = {}
+
+    def _headers(self, headers: Optional[dict] = None) -> dict:
+        headers = dict(headers or {})
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        return headers
+
+    @staticmethod
+    def _resource(path: str) -> str:
+        return "search" if path.startswith("/search/") else "core"
+
+    def _wait_for_budget(self, resource: str):
+        """
+        Reserve one request of a rate limit resource, sleeping when its budget is low.
+        :param resource: Rate limit resource
+        """
+        with self._lock:
+            remaining, reset = self._limits.get(resource, (None, 0))
+            now = time.time()
+            if remaining is None or reset <= now:
+                return
+            self._limits[resource] = (remaining - 1, reset)
+            if remaining > GITHUB_RATE_RESERVE:
+                return
+            # Spread the remaining requests over the rest of the window, wait for the reset when none are left
+            delay = reset - now if remaining <= 0 else (reset - now) / remaining
+        if delay > GITHUB_MAX_WAIT:
+            print(f"GitHub {resource} rate limit is exhausted for {int(delay)} s, waiting {int(GITHUB_MAX_WAIT)} s")
+        time.sleep(min(delay, GITHUB_MAX_WAIT))
+
+    def _track(self, response: requests.Response, resource: str):
+        """
+        Update the rate limit state from the headers of a response.
+        :param response: Response fetched from GitHub
+        :param resource: Rate limit resource of the request
+        """
+        if getattr(response, "from_cache", False) or 'X-RateLimit-Remaining' not in response.headers:
+            return
+        resource = response.headers.get('X-RateLimit-Resource', resource)
+        remaining = int(response.headers['X-RateLimit-Remaining'])
+        reset = int(response.headers.get('X-RateLimit-Reset', 0))
+        with self._lock:
+            known_remaining, known_reset = self._limits.get(resource, (None, 0))
+            # Responses of concurrent requests arrive out of order, keep the lowest count of a window
+            if known_remaining is not None and known_reset == reset:
+                remaining = min(remaining, known_remaining)
+            self._limits[resource] = (remaining, reset)
+
+    @staticmethod
+    def _rate_limited(response: requests.Response) -> bool:
+        return response.status_code in (403, 429) and response.headers.get('X-RateLimit-Remaining') == '0'
+
+    def get(self, path: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> requests.Response:
+        """
+        Send a GET request to the REST API.
+        :param path: API path, e.g. /repos/{owner}/{repo}
+        :param params: Query parameters
+        :param headers: Request headers
+        :return: Response, a rate limited request is retried once after the limit resets
+        """
+        resource = self._resource(path)
+        for attempt in range(2):
+            self._wait_for_budget(resource)
+            response = cached_get(f"{GITHUB_API}{path}", params=params, headers=self._headers(headers))
+            self._track(response, resource)
+            if not self._rate_limited(response) or attempt == 1:
+                return response
+        return response
+
+    def graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run a GraphQL query, requires a token.
+        :param query: GraphQL query
+        :param variables: Query variables
+        :return: Data of the response, fields that failed to resolve are None
+        """
+        self._wait_for_budget("graphql")
+        response = http_post(GITHUB_GRAPHQL, json={"query": query, "variables": variables},
+                             headers=self._headers())
+        self._track(response, "graphql")
+        response.raise_for_status()
+        return response.json().get("data") or {}
+
+    def search_repositories(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Search repositories.
+        :param query: GitHub search query
+        :return: Repositories sorted by relevance
+        """
+        response = self.get("/search/repositories", params={"q": query})
+        response.raise_for_status()
+        return response.json()['items']
+
+    def search_many(self, queries: List[str]) -> List[List[Dict[str, Any]]]:
+        """
+        Run several repository searches concurrently.
+        :param queries: GitHub search queries
+        :return: For every query its repositories, in the order of the queries
+        """
+        if not queries:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(queries))) as executor:
+            return list(executor.map(propagate(self.search_repositories), queries))
+
+    def get_readme(self, owner: str, repo: str) -> str:
+        """
+        Fetch the raw README of a repository.
+        :param owner: Owner of the repository
+        :param repo: Name of the repository
+        :return: Content of the README, README_NOT_AVAILABLE if there is none
+        """
+        response = self.get(f"/repos/{owner}/{repo}/readme", headers={'Accept': 'application/vnd.github.v3.raw'})
+        if response.status_code == 200:
+            return response.text
+        return README_NOT_AVAILABLE
+
+    def get_tree(self, owner: str, repo: str, ref: str = "HEAD") -> List[Dict[str, Any]]:
+        """
+        List every file of a repository with one call to the git trees API.
+        :param owner: Owner of the repository
+        :param repo: Name of the repository
+        :param ref: Branch, tag or commit
+        :return: Blob entries with path and size, truncated by GitHub for very large repositories
+        """
+        response = self.get(f"/repos/{owner}/{repo}/git/trees/{ref}", params={"recursive": "1"})
+        response.raise_for_status()
+        tree = response.json()
+        if tree.get("truncated"):
+            print(f"Tree of {owner}/{repo} is truncated, only part of the files is considered")
+        return [entry for entry in tree["tree"] if entry["type"] == "blob"]
+
+    def _graphql_readmes(self, full_names: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Fetch READMEs of up to GRAPHQL_BATCH_SIZE repositories in one GraphQL query.
+        :param full_names: Repositories as owner/name
+        :return: README per repository, None where no README was found at a known path
+        """
+        declarations, fields, variables = [], [], {}
+        for i, full_name in enumerate(full_names):
+            owner, name = full_name.split('/', 1)
+            declarations.append(f"$o{i}: String!, $n{i}: String!")
+            variables.update({f"o{i}": owner, f"n{i}": name})
+            blobs = ' '.join(f'f{j}: object(expression: "{expression}") {{ ... on Blob {{ text }} }}'
+                             for j, expression in enumerate(README_EXPRESSIONS))
+            fields.append(f"r{i}: repository(owner: $o{i}, name: $n{i}) {{ {blobs} }}")
+        query = f"query({', '.join(declarations)}) {{ {' '.join(fields)} }}"
+        data = self.graphql(query, variables)
+
+        readmes = {}
+        for i, full_name in enumerate(full_names):
+            blobs = data.get(f"r{i}") or {}
+            texts = [(blobs.get(f"f{j}") or {}).get("text") for j in range(len(README_EXPRESSIONS))]
+            readmes[full_name] = next((text for text in texts if text), None)
+        return readmes
+
+    def fetch_readmes(self, full_names: List[str]) -> Dict[str, str]:
+        """
+        Fetch READMEs of many repositories with as few calls as possible.
+        :param full_names: Repositories as owner/name
+        :return: README per repository, README_NOT_AVAILABLE if there is none
+        """
+        readmes = {}
+        if self.token:
+            batches = [full_names[i:i + GRAPHQL_BATCH_SIZE] for i in range(0, len(full_names), GRAPHQL_BATCH_SIZE)]
+            for batch in batches:
+                try:
+                    readmes.update({name: text for name, text in self._graphql_readmes(batch).items() if text})
+                except requests.exceptions.RequestException as e:
+                    print(f"GraphQL README lookup failed, falling back to REST: {e}")
+
+        # Repositories without a token, outside the known README paths or failed in GraphQL
+        missing = [full_name for full_name in full_names if full_name not in readmes]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                texts = executor.map(propagate(lambda full_name: self.get_readme(*full_name.split('/', 1))),
+                                     missing)
+                readmes.update(zip(missing, texts))
+        return readmes
+
+
+_github_client = None
+_github_client_lock = threading.Lock()
+
+
+def get_github_client() -> GitHubClient:
+    """Return the process-wide GitHub client."""
+    global _github_client
+    with _github_client_lock:
+        if _github_client is None:
+            _github_client = GitHubClient()
+        return _github_client
@@ -0,0 +1,178 @@
+"""
+This module contains a local snapshot of the Hugging Face model and dataset catalog.
+
+The snapshot is a SQLite table indexed by pipeline tag, license, popularity and modification date, so
+task listing, filtering and sorting queries are answered without calling huggingface.co. It is refreshed
+periodically with `python -m tools.hf_catalog`.
+"""
+import argparse
+import os
+import threading
+import time
+from typing import List, Optional
+
+from tools.hf_data_model import HubItem
+from tools.hf_search import HuggingFaceSearch
+from utils.http_client import http_get
+from utils.storage import cache_dir, open_sqlite
+
+HF_CATALOG_MAX_AGE = float(os.getenv("HF_CATALOG_MAX_AGE", str(7 * 24 * 60 * 60)))
+CATALOG_TYPES = ('model', 'dataset')
+CATALOG_FIELDS = ['downloads', 'likes', 'trendingScore', 'createdAt', 'lastModified', 'pipeline_tag', 'tags']
+# Sorting options of the website mapped to catalog columns
+SORT_COLUMNS = {'trending': 'trending', 'likes': 'likes', 'downloads': 'downloads',
+                'created': 'created_at', 'modified': 'last_modified'}
+CATALOG_PAGE_SIZE = 1000
+
+
+class HubCatalog:
+    """
+    SQLite snapshot of the most downloaded models and datasets on huggingface.co.
+    """
+
+    def __init__(self, directory: Optional[str] = None, hf_url: str = "https://huggingface.co"):
+        """
+        Initialize the catalog.
+        :param directory: Directory of the catalog, defaults to HF_CATALOG_DIR or the cache root
+        :param hf_url: HuggingFace URL
+        """
+        self.directory = directory or os.getenv("HF_CATALOG_DIR") or cache_dir("hf_catalog")
+        os.makedirs(self.directory, exist_ok=True)
+        self.hf_url = hf_url
+
+        self._lock = threading.Lock()
+        self._db = open_sqlite(os.path.join(self.directory, "catalog.sqlite"))
+        self._db.execute("CREATE TABLE IF NOT EXISTS items ("
+                         "item_type TEXT NOT NULL, item_id TEXT NOT NULL, pipeline_tag TEXT, license TEXT,"
+                         " downloads INTEGER NOT NULL, likes INTEGER NOT NULL, trending REAL NOT NULL,"
+                         " created_at TEXT, last_modified TEXT, PRIMARY KEY (item_type, item_id))")
+        for column in ('pipeline_tag', 'license', 'downloads', 'likes', 'last_modified'):
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS items_{column} ON items (item_type, {column})")
+        self._db.execute("CREATE TABLE IF NOT EXISTS refreshes (item_type TEXT PRIMARY KEY, refreshed_at REAL NOT NULL)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def is_fresh(self, item_type: str, max_age: float = HF_CATALOG_MAX_AGE) -> bool:
+        """
+        Check whether the snapshot of a type can answer queries.
+        :param item_type: 'model' or 'dataset'
+        :param max_age: Maximum age of the snapshot in seconds
+        :return: True if the type was refreshed within max_age
+        """
+        with self._lock:
+            row = self._db.execute("SELECT refreshed_at FROM refreshes WHERE item_type = ?", (item_type,)).fetchone()
+        return row is not None and time.time() - row[0] < max_age
+
+    @staticmethod
+    def _row_from_api(item_type: str, data: dict) -> tuple:
+        tags = data.get('tags') or []
+        license_tag = next((tag.split(':', 1)[1] for tag in tags if tag.startswith('license:')), None)
+        pipeline_tag = data.get('pipeline_tag')
+        if pipeline_tag is None:
+            # Datasets carry their tasks as task_categories tags
+            pipeline_tag = next((tag.split(':', 1)[1] for tag in tags if tag.startswith('task_categories:')), None)
+        return (item_type, data['id'], pipeline_tag, license_tag, data.get('downloads') or 0, data.get('likes') or 0,
+                data.get('trendingScore') or 0, data.get('createdAt'), data.get('lastModified'))
+
+    def refresh(self, item_type: str, limit: int = 50000) -> int:
+        """
+        Replace the snapshot of a type with the most downloaded items of the API.
+        :param item_type: 'model' or 'dataset'
+        :param limit: Maximum number of items in the snapshot
+        :return: Number of stored items
+        """
+        url = f"{self.hf_url}/api/{item_type}s"
+        params = {'sort': 'downloads', 'direction': -1, 'limit': min(CATALOG_PAGE_SIZE, limit),
+                  'expand[]': CATALOG_FIELDS}
+        rows = []
+        while url and len(rows) < limit:
+            response = http_get(url, params=params)
+            response.raise_for_status()
+            rows.extend(self._row_from_api(item_type, data) for data in response.json())
+            # The API pages with a cursor in the Link header, the next URL carries every parameter
+            url, params = response.links.get('next', {}).get('url'), None
+        rows = rows[:limit]
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM items WHERE item_type = ?", (item_type,))
+            self._db.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO refreshes VALUES (?, ?)", (item_type, time.time()))
+            self._db.execute("COMMIT")
+        return len(rows)
+
+    def tasks(self, item_type: str = 'model') -> List[str]:
+        """
+        List pipeline tags in the snapshot.
+        :param item_type: 'model' or 'dataset'
+        :return: Pipeline tags sorted by the number of items
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT pipeline_tag FROM items WHERE item_type = ? AND pipeline_tag IS NOT NULL"
+                                    " GROUP BY pipeline_tag ORDER BY COUNT(*) DESC", (item_type,)).fetchall()
+        return [row[0] for row in rows]
+
+    def query(self, item_type: str = 'model', pipeline_tag: Optional[str] = None, license: Optional[str] = None,
+              search: Optional[str] = None, sort_by: str = 'downloads', limit: int = 20) -> List[HubItem]:
+        """
+        Filter and sort the snapshot.
+        :param item_type: 'model' or 'dataset'
+        :param pipeline_tag: Only items of this task
+        :param license: Only items with this license, e.g. mit or apache-2.0
+        :param search: Only items whose ID contains this text
+        :param sort_by: 'trending', 'likes', 'downloads', 'created' or 'modified', descending
+        :param limit: Maximum number of items
+        :return: Matching items
+        """
+        conditions, values = ["item_type = ?"], [item_type]
+        if pipeline_tag:
+            conditions.append("pipeline_tag = ?")
+            values.append(pipeline_tag)
+        if license:
+            conditions.append("license = ?")
+            values.append(license)
+        if search:
+            conditions.append("item_id LIKE ? ESCAPE '\\'")
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            values.append(f"%{escaped}%")
+        column = SORT_COLUMNS.get(sort_by, 'downloads')
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT item_id, pipeline_tag, downloads, likes, last_modified FROM items"
+                f" WHERE {' AND '.join(conditions)} ORDER BY {column} DESC LIMIT ?", (*values, limit)).fetchall()
+
+        items = []
+        for item_id, item_pipeline_tag, downloads, likes, last_modified in rows:
+            item_name = HuggingFaceSearch.item_path(item_type, item_id)
+            items.append(HubItem(item_name=item_name, item_link=f"{self.hf_url}{item_name}", item_type=item_type,
+                                 downloads=downloads, likes=likes, last_modified=last_modified,
+                                 pipeline_tag=item_pipeline_tag))
+        return items
+
+
+_hub_catalog = None
+_hub_catalog_lock = threading.Lock()
+
+
+def get_hub_catalog() -> HubCatalog:
+    """Return the process-wide Hugging Face catalog snapshot."""
+    global _hub_catalog
+    with _hub_catalog_lock:
+        if _hub_catalog is None:
+            _hub_catalog = HubCatalog()
+        return _hub_catalog
+
+
+if __name__ == "__main__":
+    # Periodic update, e.g. python -m tools.hf_catalog --type model --type dataset
+    parser = argparse.ArgumentParser(description="Refresh the local Hugging Face catalog snapshot")
+    parser.add_argument("--type", action="append", choices=CATALOG_TYPES, default=[], help="Item type to refresh")
+    parser.add_argument("--limit", type=int, default=50000, help="Most downloaded items kept per type")
+    args = parser.parse_args()
+
+    catalog = HubCatalog()
+    for catalog_type in args.type or CATALOG_TYPES:
+        stored = catalog.refresh(catalog_type, args.limit)
+        print(f"{catalog_type}: stored {stored} items, catalog has {len(catalog)}")
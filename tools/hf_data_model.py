@@ -0,0 +1,18 @@
+"""
+Data models for huggingface
+"""
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class HubItem(BaseModel):
+    """Model, dataset or space on huggingface.co"""
+    item_name: str
+    item_link: str
+    item_type: str
+    downloads: Optional[int] = None
+    likes: Optional[int] = None
+    last_modified: Optional[str] = None
+    pipeline_tag: Optional[str] = None
+    item_matches: Optional[str] = None
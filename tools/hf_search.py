@@ -1,52 +1,127 @@
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List
 
-import openai
 import requests
-import tiktoken
-from bs4 import BeautifulSoup
+
+from tools.hf_data_model import HubItem
+from utils.clients import get_openai_client
+from utils.http_cache import cached_get
+from utils.llm_cache import get_completion_cache
+from utils.tokens import split_text_by_tokens
+from utils.tracing import annotate, propagate
+from tools.utils_text_summary_tools import map_reduce_summarize
+
+SUMMARY_SYSTEM_PROMPT = "You're a researcher who analyse the files and gives a summary with most relevant info"
+SUMMARY_USER_PROMPT = "Give short summary the following README content:\n\n{chunk}"
+NO_SUMMARY = "No summary"
+
+HF_PAGE_SIZE = 20
+HF_CONCURRENCY = int(os.getenv("HF_CONCURRENCY", "4"))
+# Fields requested from the JSON API, everything else is left out of the response
+HF_API_FIELDS = {
+    'model': ['downloads', 'likes', 'lastModified', 'pipeline_tag'],
+    'dataset': ['downloads', 'likes', 'lastModified'],
+    'space': ['likes', 'lastModified'],
+}
+HF_SORT_FIELDS = {'trending': 'trendingScore', 'likes': 'likes', 'downloads': 'downloads',
+                  'created': 'createdAt', 'modified': 'lastModified'}
+
 
 class HuggingFaceSearch:
-    def __init__(self, hf_url = "https://huggingface.co"):
+    def __init__(self, hf_url = "https://huggingface.co", catalog=None):
         """
         Initialize HuggingFaceSearch class.
         :param hf_url: HuggingFace URL.
+        :param catalog: Optional HubCatalog, while its snapshot is fresh listing queries are answered from it.
         """
         self.hf_url = hf_url
+        self.catalog = catalog
+
+    def _use_catalog(self, info_type: str) -> bool:
+        return self.catalog is not None and self.catalog.is_fresh(info_type)
+
+    @staticmethod
+    def item_path(info_type: str, item_id: str) -> str:
+        """Path of a repository on the hub, e.g. /owner/name for a model or /datasets/owner/name for a dataset."""
+        return f"/{item_id}" if info_type == 'model' else f"/{info_type}s/{item_id}"
+
+    def _item_from_api(self, info_type: str, data: dict) -> HubItem:
+        item_name = self.item_path(info_type, data['id'])
+        return HubItem(item_name=item_name, item_link=f"{self.hf_url}{item_name}", item_type=info_type,
+                       downloads=data.get('downloads'), likes=data.get('likes'),
+                       last_modified=data.get('lastModified'), pipeline_tag=data.get('pipeline_tag'))
+
+    def search_api(self, info_type: str, params: dict) -> List[HubItem]:
+        """
+        Search the JSON API of huggingface.co
+        :param info_type: Type of search, possible values - 'model', 'dataset', 'space'
+        :param params: Query parameters of the API, e.g. search, pipeline_tag, sort and limit
+        :return: List of items with popularity and last modification date
+        """
+        response = cached_get(f"{self.hf_url}/api/{info_type}s",
+                              params={**params, 'expand[]': HF_API_FIELDS[info_type]})
+        response.raise_for_status()
+        return [self._item_from_api(info_type, data) for data in response.json()]
+
+    def _scrape_full_text_page(self, url: str, info_type: str) -> List[HubItem]:
+        """
+        Parse one page of the full-text search website
+        :param url: URL of the result page
+        :param info_type: Type of search, possible values - 'model', 'dataset', 'space'
+        :return: List of items found on the page
+        """
+        from bs4 import BeautifulSoup
+
+        response = cached_get(url)
+        soup = BeautifulSoup(response.content.decode('utf8'), features="html.parser")
+        items = []
+        for item in soup.find_all('div', class_='transform'):
+            item_name = item.find('h4').find_all('a')[1].attrs['href']
+            item_matches = item.find('header').find_all('div')[-1].text.replace('\n', ' ').replace('\t', ' ').strip()
+            items.append(HubItem(item_name=item_name, item_link=f"{self.hf_url}{item_name}", item_type=info_type,
+                                 item_matches=item_matches))
+        return items
 
-    def huggingface_info_by_context(self, info_type: str, query: str, total_pages:int = 1) -> list:
+    def huggingface_info_by_context(self, info_type: str, query: str, total_pages: int = 1) -> Iterator[HubItem]:
         """
-        Returns results from available models on huggingface.co
+        Returns results from available models on huggingface.co, the JSON API is used first and the full-text
+        search website when the API finds nothing
         :param info_type: Type of search, possible values - 'model', 'dataset', 'space'
         :param query: The search query that will be used, keywords or sentence
         :param total_pages: The total number of pages to return results (20 items per page)
-        :return: List of dictionaries for models and datasets
+        :return: Generator of items for models, datasets and spaces
         Example:
-        [{'item_name': '/hilmansw/resnet18-catdog-classifier',
-        'item_link': 'https://huggingface.co/hilmansw/resnet18-catdog-classifier',
-        'item_read_me': 'https://huggingface.co/hilmansw/resnet18-catdog-classifier/blob/main/README.md?code=true',
-        'item_matches': '2 matches'}]
+        [HubItem(item_name='/hilmansw/resnet18-catdog-classifier',
+        item_link='https://huggingface.co/hilmansw/resnet18-catdog-classifier', item_type='model',
+        downloads=120, likes=2, last_modified='2023-11-02T08:11:31.000Z', pipeline_tag='image-classification')]
         """
+        if self._use_catalog(info_type):
+            items = self.catalog.query(info_type, search=query, limit=HF_PAGE_SIZE * total_pages)
+            if items:
+                yield from items
+                return
 
+        try:
+            items = self.search_api(info_type, {'search': query, 'limit': HF_PAGE_SIZE * total_pages,
+                                                'sort': 'downloads', 'direction': -1})
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"HF API search failed, falling back to full-text search: {e}")
+            items = []
+        if items:
+            yield from items
+            return
+
+        # The API matches repository names only, the full-text search also looks into model cards
         query = re.sub(r'\s+', '+', query)
-        page = 0
         base_url = f"{self.hf_url}/search/full-text?q={query}&type={info_type}"
-
+        urls = [base_url + f'&p={page}' for page in range(total_pages)]
+        scrape = propagate(lambda url: self._scrape_full_text_page(url, info_type))
         try:
-            while total_pages > 0:
-                response = requests.get(base_url + f'&p={page}')
-                soup = BeautifulSoup(response.content.decode('utf8'), features="html.parser")
-                for item in soup.find_all('div', class_='transform'):
-                    item_name = item.find('h4').find_all('a')[1].attrs['href']
-                    item_link = f"{self.hf_url}{item_name}"
-                    item_read_me = f"{self.hf_url}{item.find_all('h4')[1].find('a').attrs['href']}"
-                    item_matches = item.find('header').find_all('div')[-1].text.replace('\n', ' ').replace('\t',
-                                                                                                           ' ').strip()
-
-                    yield {"item_name": item_name, "item_link": item_link,
-                           "item_matches": item_matches}
-                total_pages -= 1
-                page += 1
+            with ThreadPoolExecutor(max_workers=min(HF_CONCURRENCY, len(urls) or 1)) as executor:
+                for page_items in executor.map(scrape, urls):
+                    yield from page_items
         except Exception as e:
             print(e)
 
@@ -55,11 +130,23 @@ class HuggingFaceSearch:
         Returns the list of possible tasks for models available on huggingface.co
         :return: List of tasks
         """
+        if self._use_catalog('model'):
+            return self.catalog.tasks('model')
+
+        try:
+            response = cached_get(f"{self.hf_url}/api/tasks")
+            response.raise_for_status()
+            return list(response.json())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"HF API tasks failed, falling back to the website: {e}")
+
+        from bs4 import BeautifulSoup
+
         url = f"{self.hf_url}/models"
 
         try:
-            response = requests.get(url)
-            soup = BeautifulSoup(response.content.decode('utf8'))
+            response = cached_get(url)
+            soup = BeautifulSoup(response.content.decode('utf8'), features="html.parser")
 
             possible_tasks = []
 
@@ -71,59 +158,88 @@ class HuggingFaceSearch:
 
     @staticmethod
     def get_possible_sorting_options() -> list:
-        return ['trending', 'likes', 'downloads', 'created', 'modified']
+        return list(HF_SORT_FIELDS)
 
-    def list_models_by_tasks(self, task: str, sort_by: str, search: str = None) -> list:
+    def list_models_by_tasks(self, task: str, sort_by: str, search: str = None,
+                             license: str = None) -> Iterator[HubItem]:
         """Returns first page of results from available models on huggingface.co
         :param task: Filter by possible tasks in machine learning. Can be received from get_possible_tasks_for_models
         :param sort_by: Sorting of the search results, possible values - 'trending', 'likes', 'downloads', 'created', 'modified'
         :param search: Search qwery that will be used, mostly look on model names
-        :return: List of information about relevant models
+        :param license: Only models with this license, e.g. mit or apache-2.0
+        :return: Generator of models
         Example:
-        [{'model_name': 'openai/whisper-large-v2',
-        'last_updated': '2024-02-29T10:57:50',
-        'liked': '1.66k'}]
+        [HubItem(item_name='/openai/whisper-large-v2', item_link='https://huggingface.co/openai/whisper-large-v2',
+        item_type='model', downloads=531233, likes=1660, last_modified='2024-02-29T10:57:50.000Z',
+        pipeline_tag='automatic-speech-recognition')]
         """
+        if self._use_catalog('model'):
+            yield from self.catalog.query('model', pipeline_tag=task, license=license, search=search,
+                                          sort_by=sort_by, limit=HF_PAGE_SIZE)
+            return
+
+        params = {'pipeline_tag': task, 'sort': HF_SORT_FIELDS.get(sort_by, sort_by), 'direction': -1,
+                  'limit': HF_PAGE_SIZE}
+        if search:
+            params['search'] = search
+        if license:
+            params['filter'] = f"license:{license}"
+
+        try:
+            yield from self.search_api('model', params)
+            return
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            print(f"HF API search failed, falling back to the website: {e}")
+
+        from bs4 import BeautifulSoup
+
         url = f"{self.hf_url}/models?pipeline_tag={task}&sort={sort_by}"
 
         if search:
             url += f"&search={search}"
 
         try:
-            response = requests.get(url)
-            soup = BeautifulSoup(response.content.decode('utf8'))
+            response = cached_get(url)
+            soup = BeautifulSoup(response.content.decode('utf8'), features="html.parser")
 
             for model in soup.find_all('article'):
-                liked = model.find_all("svg")[-1].find_next_sibling(string=True).strip()
-
-                model_name = model.find('a').attrs['href'][1:]
+                model_name = model.find('a').attrs['href']
                 timestamp = model.find('time').attrs['datetime']
-                yield {"model_name": model_name, "last_updated": timestamp, "liked": liked}
+                yield HubItem(item_name=model_name, item_link=f"{self.hf_url}{model_name}", item_type='model',
+                              last_modified=timestamp, pipeline_tag=task)
         except Exception as e:
             print(e)
 
     @staticmethod
-    def summarize_one_chunk(chunk: str) -> str:
+    def summarize_one_chunk(chunk: str, bypass_cache: bool = False) -> str:
         """
         Summarize one portion of text from the long page.
         :param chunk: Text portion that will be summarized
+        :param bypass_cache: Call the model even if the summary is cached
         :return: Summary of the chunk
         """
-        try:
-            client = openai.OpenAI(
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
+        model, temperature = "gpt-4o-mini", 0.5
+
+        def complete() -> str:
+            client = get_openai_client()
             messages_for_model = [
-                {"role": "system",
-                 "content": "You're a researcher who analyse the files and gives a summary with most relevant info"},
-                {"role": "user", "content": f"Give short summary the following README content:\n\n{chunk}"}]
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": SUMMARY_USER_PROMPT.format(chunk=chunk)}]
 
             response = client.chat.completions.create(
-                model="gpt-4o-mini",
+                model=model,
                 messages=messages_for_model,
-                temperature=0.5,
+                temperature=temperature,
             )
+            if response.usage is not None:
+                annotate(prompt_tokens=response.usage.prompt_tokens,
+                         completion_tokens=response.usage.completion_tokens)
             return response.choices[0].message.content
+
+        try:
+            return get_completion_cache().get_or_compute(model, temperature,
+                                                         SUMMARY_SYSTEM_PROMPT + SUMMARY_USER_PROMPT, chunk,
+                                                         complete, bypass=bypass_cache)
         except requests.exceptions.RequestException as e:
             print(f"Error fetching README: {e}")
             return None
@@ -136,13 +252,7 @@ class HuggingFaceSearch:
         Returns:A list of text portions.
         """
 
-        tokenizer = tiktoken.encoding_for_model("gpt-4o-mini")
-        tokens = tokenizer.encode(long_text)
-
-        chunks = [tokens[i:i + chunk_size] for i in range(0, len(tokens), chunk_size)]
-        decoded_chunks = [tokenizer.decode(chunk) for chunk in chunks]
-
-        return decoded_chunks
+        return split_text_by_tokens(long_text, chunk_size)
 
     def summarize_page(self, page_url: str) -> str:
         """
@@ -150,22 +260,17 @@ class HuggingFaceSearch:
         :param page_url: Link to the page that needs to be summarized
         :return: Full summary of the page
         """
+        from bs4 import BeautifulSoup
+
         try:
-            response = requests.get(page_url)
+            response = cached_get(page_url)
             response.raise_for_status()  # Raise an exception for bad status codes
             soup = BeautifulSoup(response.content.decode('utf8'))
             readme_content = soup.get_text(separator='\n').replace('\n', ' ').replace('\t', ' ').strip()
             readme_content = ' '.join(readme_content.split())
 
-            tokenizer = tiktoken.encoding_for_model("gpt-4o-mini")
-            tokens = tokenizer.encode(readme_content)
-
-            if len(tokens) > 128000:
-                readme_content = self.split_text_by_tokens(readme_content)
-                summaries = [self.summarize_one_chunk(chunk) for chunk in readme_content]
-                return ' '.join(summaries)
-
-            return self.summarize_one_chunk(readme_content)
+            summary = map_reduce_summarize(readme_content, self.summarize_one_chunk, self.summarize_one_chunk)
+            return summary or NO_SUMMARY
         except requests.exceptions.RequestException as e:
             print(f"Error fetching README: {e}")
-            return "No summary"
+            return NO_SUMMARY
@@ -1,12 +1,67 @@
-import openai
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
 
+from utils.clients import get_chat_model
+from utils.llm_cache import get_completion_cache
 from utils.pdf_parser import PDFParser
+from utils.tokens import count_tokens, split_text_by_tokens
+from utils.tracing import annotate, propagate
 
 load_dotenv()
-openai.api_key = os.getenv('OPENAI_API_KEY')
+ARXIV_SELECTIVE_EXTRACTION = os.getenv("ARXIV_SELECTIVE_EXTRACTION", "1") == "1"
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "100000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+
+
+def _group_by_tokens(texts: List[str], max_tokens: int) -> List[List[str]]:
+    """Pack consecutive texts into groups that stay under max_tokens, at least two texts per group."""
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if len(current) >= 2 and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if len(current) == 1 and groups:
+        groups[-1].append(current[0])
+    elif current:
+        groups.append(current)
+    return groups
+
+
+def map_reduce_summarize(text: str, summarize_chunk: Callable[[str], Optional[str]],
+                         combine: Callable[[str], Optional[str]],
+                         chunk_tokens: int = SUMMARY_CHUNK_TOKENS,
+                         max_workers: int = SUMMARY_CONCURRENCY) -> str:
+    """
+    Summarize a text of any length: split it by tokens, summarize the chunks concurrently
+    and combine the partial summaries level by level until one summary is left.
+
+    Args:
+        text (str): Text to summarize
+        summarize_chunk (Callable): Summarizes one chunk
+        combine (Callable): Merges several partial summaries joined by blank lines
+        chunk_tokens (int): Maximum tokens sent in one request
+        max_workers (int): Maximum number of concurrent requests
+
+    Returns:
+        str: Summary of the whole text, empty if no chunk could be summarized
+    """
+    chunks = split_text_by_tokens(text, chunk_tokens)
+    if len(chunks) <= 1:
+        return summarize_chunk(text) or ""
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        summaries = [summary for summary in pool.map(propagate(summarize_chunk), chunks) if summary]
+        while len(summaries) > 1:
+            groups = _group_by_tokens(summaries, chunk_tokens)
+            summaries = [summary for summary in pool.map(propagate(combine), ["\n\n".join(group) for group in groups])
+                         if summary]
+    return summaries[0] if summaries else ""
+
 
 class Summarizer:
     """
@@ -15,13 +70,13 @@ class Summarizer:
     def __init__(self, type_task: str = 'text'):
         """
         Initialize the Summarizer with the type of task.
-        :param type_task: text or code
+        :param type_task: text, code, code_files or combine
         """
         self.model = "gpt-4o-mini"
         self.temperature = 0.3
         self.n = 1
         self.type_task = type_task
-        self.client = ChatOpenAI(model=self.model, temperature=self.temperature, n=self.n)
+        self.client = get_chat_model(self.model, self.temperature, n=self.n)
 
     def prompt_generation(self) -> str:
         """
@@ -32,35 +87,68 @@ class Summarizer:
             return "Please provide a concise summary of the following text:"
         elif self.type_task == 'code':
             return "Please provide a step-by-step explanation of what the following code does:"
+        elif self.type_task == 'code_files':
+            return ("Please briefly explain what each of the following code files does,"
+                    " one paragraph per file:")
+        elif self.type_task == 'combine':
+            return ("Please merge the following partial summaries of one document"
+                    " into a single concise summary:")
 
-    def summarize_text(self, text: str) -> str:
+    def summarize_text(self, text: str, bypass_cache: bool = False) -> str:
         """
         Summarize the given text using OpenAI API.
 
         Args:
             text (str): The text to be summarized.
+            bypass_cache (bool): Call the model even if the summary is cached.
         Returns:
             str: The summary of the given text.
         """
+        template = self.prompt_generation()
 
-        messages = [{"role": "user", "content": self.prompt_generation() + text}]
-        response = self.client.invoke(messages)
-        return response.content.strip()
+        def complete() -> str:
+            messages = [{"role": "user", "content": template + text}]
+            response = self.client.invoke(messages)
+            usage = response.usage_metadata or {}
+            annotate(prompt_tokens=usage.get("input_tokens"), completion_tokens=usage.get("output_tokens"))
+            return response.content.strip()
 
-    def summarize_text_pipeline(self, arxiv_url: str) -> str:
+        return get_completion_cache().get_or_compute(self.model, self.temperature, template, text,
+                                                     complete, bypass=bypass_cache)
+
+    def summarize_paper(self, arxiv_url: str) -> Tuple[str, List[str]]:
         """
-        Summarize the text from the given URL using OpenAI API.
+        Summarize a paper without any instructions for the agent.
 
         Args:
             arxiv_url (str): The URL to extract text from and summarize.
         Returns:
-            str: The summary of the text from the given URL.
+            Tuple[str, List[str]]: The summary of the paper and the Git links found in it.
+        Raises:
+            ValueError: If no part of the paper could be summarized.
         """
         pdf_parser = PDFParser(arxiv_url)
 
-        result = pdf_parser.process_pdf_url()
+        # Abstract, introduction, method and conclusion only, references and appendices are dropped
+        result = pdf_parser.process_pdf_url(selective=ARXIV_SELECTIVE_EXTRACTION)
         text, links = result['text'], result['links']
 
-        summary = self.summarize_text(text) + f"\n Useful links to include in summary as GitHub link to this archive: {links}"
+        combiner = Summarizer('combine')
+        summary = map_reduce_summarize(text, self.summarize_text, combiner.summarize_text)
+        if not summary:
+            raise ValueError(f"No summary could be generated for {arxiv_url}")
+        return summary, links
+
+    def summarize_text_pipeline(self, arxiv_url: str) -> str:
+        """
+        Summarize the text from the given URL using OpenAI API.
+
+        Args:
+            arxiv_url (str): The URL to extract text from and summarize.
+        Returns:
+            str: The summary of the text from the given URL.
+        """
+        summary, links = self.summarize_paper(arxiv_url)
+        summary += f"\n Useful links to include in summary as GitHub link to this archive: {links}"
 
         return summary
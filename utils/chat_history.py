@@ -0,0 +1,98 @@
+"""
+This module contains a bounded store of agent chat histories.
+
+Histories are kept in an LRU map with a fixed number of sessions. Sessions evicted while their task still
+runs are dropped or spilled to disk and reloaded on their next turn, finished sessions are released and
+dropped, so the spill directory only holds histories of running tasks.
+
+Histories are not compacted: a task runs a single agent turn, its history only holds the input and the
+answer, and the tool messages of the turn stay in the agent scratchpad.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+from utils.storage import cache_dir
+
+CHAT_HISTORY_MAX_SESSIONS = int(os.getenv("CHAT_HISTORY_MAX_SESSIONS", "256"))
+CHAT_HISTORY_SPILL = os.getenv("CHAT_HISTORY_SPILL", "0") == "1"
+
+
+class ChatHistoryStore:
+    """
+    LRU map of session ID to chat history, with optional spill of evicted live histories to disk.
+    """
+
+    def __init__(self, max_sessions: int = CHAT_HISTORY_MAX_SESSIONS, spill_dir: Optional[str] = None):
+        """
+        Initialize the store.
+        :param max_sessions: Maximum number of histories kept in memory
+        :param spill_dir: Directory for evicted histories, None drops them
+        """
+        self.max_sessions = max_sessions
+        self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _spill_path(self, session_id: str) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha256(session_id.encode('utf8')).hexdigest() + ".json")
+
+    def _spill(self, session_id: str, history: InMemoryChatMessageHistory):
+        if not self.spill_dir or not history.messages:
+            return
+        path = self._spill_path(session_id)
+        with open(path + ".tmp", 'w') as spill_file:
+            json.dump(messages_to_dict(history.messages), spill_file)
+        os.replace(path + ".tmp", path)
+
+    def _load(self, session_id: str) -> InMemoryChatMessageHistory:
+        history = InMemoryChatMessageHistory()
+        if self.spill_dir and os.path.exists(self._spill_path(session_id)):
+            path = self._spill_path(session_id)
+            with open(path) as spill_file:
+                history.messages = messages_from_dict(json.load(spill_file))
+            os.unlink(path)
+        return history
+
+    def get(self, session_id: str) -> InMemoryChatMessageHistory:
+        """
+        Return the history of a session, creating it or loading it from disk.
+        :param session_id: Session ID, e.g. the task ID
+        :return: Chat history of the session
+        """
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = self._sessions[session_id] = self._load(session_id)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                evicted_id, evicted = self._sessions.popitem(last=False)
+                self._spill(evicted_id, evicted)
+            return history
+
+    def release(self, session_id: str):
+        """
+        Drop a finished session from memory and from the spill directory.
+        :param session_id: Session ID
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self.spill_dir and os.path.exists(self._spill_path(session_id)):
+                os.unlink(self._spill_path(session_id))
+
+
+def default_spill_dir() -> Optional[str]:
+    """Directory for spilled histories, None unless CHAT_HISTORY_SPILL is enabled."""
+    return cache_dir("chat_history") if CHAT_HISTORY_SPILL else None
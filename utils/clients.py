@@ -0,0 +1,70 @@
+"""
+This module contains process-wide model clients.
+
+Clients are created on first use and shared by every task and thread, so their HTTP connection pools are
+reused and langchain and openai are only imported when a model is actually called.
+"""
+import os
+import threading
+from typing import Callable, Dict, Tuple
+
+_clients: Dict[Tuple, object] = {}
+_clients_lock = threading.Lock()
+
+
+def _get_or_create(key: Tuple, factory: Callable[[], object]):
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+
+def get_chat_model(model: str = "gpt-4o-mini", temperature: float = 0.3, **kwargs):
+    """
+    Return the shared chat model for a configuration.
+
+    Args:
+        model (str): Model name
+        temperature (float): Sampling temperature
+        **kwargs: Further ChatOpenAI arguments, e.g. max_tokens or n
+
+    Returns:
+        ChatOpenAI: Chat model, the same object for the same arguments
+    """
+    def create():
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model, temperature=temperature, **kwargs)
+
+    return _get_or_create(("chat", model, temperature, tuple(sorted(kwargs.items()))), create)
+
+
+def get_openai_client():
+    """
+    Return the shared OpenAI client.
+
+    Returns:
+        openai.OpenAI: Client authenticated with OPENAI_API_KEY
+    """
+    def create():
+        import openai
+        return openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    return _get_or_create(("openai",), create)
+
+
+def get_embeddings(model: str = "text-embedding-ada-002", chunk_size: int = 1000):
+    """
+    Return the shared embedding model.
+
+    Args:
+        model (str): Embedding model name
+        chunk_size (int): Number of texts embedded in each request
+
+    Returns:
+        OpenAIEmbeddings: Embedding model, the same object for the same arguments
+    """
+    def create():
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=model, chunk_size=chunk_size)
+
+    return _get_or_create(("embeddings", model, chunk_size), create)
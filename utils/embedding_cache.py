@@ -0,0 +1,117 @@
+"""
+This module contains a persistent cache for text embeddings, so every paper is embedded only once per model.
+"""
+import hashlib
+import threading
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from utils.storage import cache_path, open_sqlite
+from utils.tracing import span
+
+
+class EmbeddingCache:
+    """
+    SQLite cache of float32 embeddings keyed by document ID, embedding model and text hash.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the embedding cache.
+        :param path: Path of the SQLite database
+        """
+        self.path = path or cache_path("embeddings", "embeddings.sqlite")
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db = open_sqlite(self.path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings ("
+                         "doc_id TEXT NOT NULL, model TEXT NOT NULL, text_hash TEXT NOT NULL,"
+                         " vector BLOB NOT NULL, created_at REAL NOT NULL,"
+                         " PRIMARY KEY (doc_id, model, text_hash))")
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """
+        Hash the embedded text, a changed abstract gets a new embedding.
+        :param text: Embedded text
+        :return: Hex digest of the text
+        """
+        return hashlib.sha256(text.encode('utf8')).hexdigest()
+
+    def get_many(self, model: str, doc_ids: Sequence[str], texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up embeddings.
+        :param model: Embedding model name
+        :param doc_ids: Document IDs, e.g. arXiv IDs
+        :param texts: Embedded texts, in the same order as doc_ids
+        :return: Embeddings in the same order, None where nothing is cached
+        """
+        vectors = []
+        with self._lock:
+            for doc_id, text in zip(doc_ids, texts):
+                row = self._db.execute("SELECT vector FROM embeddings WHERE doc_id = ? AND model = ? AND text_hash = ?",
+                                       (doc_id, model, self.text_hash(text))).fetchone()
+                vectors.append(np.frombuffer(row[0], dtype=np.float32) if row else None)
+            found = sum(vector is not None for vector in vectors)
+            self.hits += found
+            self.misses += len(vectors) - found
+        return vectors
+
+    def put_many(self, model: str, doc_ids: Sequence[str], texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """
+        Store embeddings.
+        :param model: Embedding model name
+        :param doc_ids: Document IDs, e.g. arXiv IDs
+        :param texts: Embedded texts
+        :param vectors: Embeddings of the texts
+        """
+        now = time.time()
+        rows = [(doc_id, model, self.text_hash(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+                for doc_id, text, vector in zip(doc_ids, texts, vectors)]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.execute("COMMIT")
+
+    def embed_documents(self, embedding_model, doc_ids: Sequence[str], texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed texts, calling the model only for texts that are not cached yet.
+        :param embedding_model: Model with an embed_documents method, e.g. OpenAIEmbeddings
+        :param doc_ids: Document IDs, e.g. arXiv IDs
+        :param texts: Texts to embed
+        :return: float32 matrix with one row per text
+        """
+        model_name = getattr(embedding_model, "model", type(embedding_model).__name__)
+        with span("embedding", model_name, texts=len(texts)) as record:
+            vectors = self.get_many(model_name, doc_ids, texts)
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            record["cache_hits"] = len(texts) - len(missing)
+            record["cache_hit"] = not missing
+            if missing:
+                new_ids = [doc_ids[i] for i in missing]
+                new_texts = [texts[i] for i in missing]
+                record["embedded_chars"] = sum(len(text) for text in new_texts)
+                new_vectors = embedding_model.embed_documents(new_texts)
+                self.put_many(model_name, new_ids, new_texts, new_vectors)
+                for i, vector in zip(missing, new_vectors):
+                    vectors[i] = np.asarray(vector, dtype=np.float32)
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(vectors)
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache."""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
@@ -0,0 +1,439 @@
+"""
+This module contains a persistent, content-addressed cache for outbound HTTP GET requests.
+
+Responses are stored on disk keyed by the normalized URL and the headers that change the
+representation. Every host has its own time to live; stale entries that carry an ETag or
+Last-Modified header are revalidated with a conditional request instead of downloaded again.
+The cache is capped in size and evicts the least recently used entries first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from utils.http_client import http_get
+from utils.storage import cache_dir
+from utils.tracing import annotate, span
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+DEFAULT_HOST_TTLS = {
+    "export.arxiv.org": 6 * HOUR,
+    "arxiv.org": 30 * DAY,
+    "api.github.com": HOUR,
+    "huggingface.co": 6 * HOUR,
+    "www.googleapis.com": DAY,
+}
+DEFAULT_TTL = HOUR
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+HTTP_CACHE_DISABLED = os.getenv("HTTP_CACHE_DISABLED", "0") == "1"
+
+# Request headers that select a different representation of the same URL
+VARY_HEADERS = ("accept", "accept-language", "authorization")
+# Response headers that must never be written to disk
+SKIPPED_HEADERS = ("set-cookie", "content-encoding", "transfer-encoding", "content-length")
+
+
+def normalize_url(url: str, params: Optional[dict] = None) -> str:
+    """
+    Normalize a URL so equivalent requests share one cache entry.
+
+    Args:
+        url (str): Request URL
+        params (dict): Optional query parameters merged into the URL
+
+    Returns:
+        str: URL with lowercase scheme and host, default port removed, sorted query and no fragment
+    """
+    url = requests.Request('GET', url, params=params).prepare().url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(':', 1)[-1]) in (('http', '80'), ('https', '443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+class HttpCache:
+    """
+    On-disk HTTP response cache with per-host TTLs, conditional revalidation and LRU eviction.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = HTTP_CACHE_MAX_BYTES,
+                 host_ttls: Optional[Dict[str, float]] = None, default_ttl: float = DEFAULT_TTL):
+        """
+        Initialize the cache.
+        :param directory: Directory for cached responses
+        :param max_bytes: Size cap of all cached bodies, least recently used entries are evicted above it
+        :param host_ttls: Seconds a response stays fresh, by host
+        :param default_ttl: Seconds a response stays fresh for hosts without an explicit TTL
+        """
+        self.directory = directory or cache_dir("http")
+        self.max_bytes = max_bytes
+        self.host_ttls = DEFAULT_HOST_TTLS if host_ttls is None else host_ttls
+        self.default_ttl = default_ttl
+
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, list]] = None  # key -> [size, last access]
+        self._total_bytes = 0
+
+    def ttl_for(self, url: str) -> float:
+        """
+        Get the time to live for a URL, parent domains are matched too.
+        :param url: Request URL
+        :return: Seconds a response stays fresh
+        """
+        host = urlsplit(url).hostname or ''
+        while host:
+            if host in self.host_ttls:
+                return self.host_ttls[host]
+            host = host.partition('.')[2]
+        return self.default_ttl
+
+    @staticmethod
+    def cache_key(url: str, headers: Optional[dict] = None) -> str:
+        """
+        Build the content address of a request.
+        :param url: Normalized request URL
+        :param headers: Request headers
+        :return: Hex digest identifying the request
+        """
+        vary = sorted((k.lower(), v) for k, v in (headers or {}).items() if k.lower() in VARY_HEADERS)
+        return hashlib.sha256(json.dumps([url, vary]).encode('utf8')).hexdigest()
+
+    def _paths(self, key: str):
+        base = os.path.join(self.directory, key[:2], key)
+        return base + '.meta', base + '.body'
+
+    def _load_index(self):
+        """Scan the cache directory once to learn entry sizes and access times."""
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total_bytes = 0
+        if not os.path.isdir(self.directory):
+            return
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.body'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                self._index[name[:-len('.body')]] = [stat.st_size, stat.st_atime]
+                self._total_bytes += stat.st_size
+
+    def _touch(self, key: str):
+        with self._lock:
+            if key in self._index:
+                self._index[key][1] = time.time()
+
+    def _read_meta(self, key: str) -> Optional[dict]:
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as meta_file:
+                meta = json.load(meta_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not os.path.exists(body_path):
+            return None
+        return meta
+
+    def _read(self, key: str):
+        meta = self._read_meta(key)
+        if meta is None:
+            return None, None
+        try:
+            with open(self._paths(key)[1], 'rb') as body_file:
+                return meta, body_file.read()
+        except FileNotFoundError:
+            return None, None
+
+    def _write_meta(self, key: str, meta: dict):
+        meta_path, _ = self._paths(key)
+        tmp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_path, meta_path)
+
+    def _tmp_body_path(self, key: str) -> str:
+        # Concurrent writers of the same key each write a private file and the last rename wins
+        body_path = self._paths(key)[1]
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        return f"{body_path}.{uuid.uuid4().hex}.tmp"
+
+    @staticmethod
+    def _response_meta(response: requests.Response) -> dict:
+        return {
+            "status": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in SKIPPED_HEADERS},
+            "encoding": response.encoding,
+            "stored_at": time.time(),
+        }
+
+    def _commit(self, key: str, tmp_path: str, meta: dict, size: int):
+        """Move a fully written body into place and account for it in the index."""
+        os.replace(tmp_path, self._paths(key)[1])
+        self._write_meta(key, meta)
+        with self._lock:
+            previous = self._index.get(key)
+            if previous:
+                self._total_bytes -= previous[0]
+            self._index[key] = [size, time.time()]
+            self._total_bytes += size
+        self._evict()
+
+    def _store(self, key: str, response: requests.Response):
+        body = response.content
+        tmp_path = self._tmp_body_path(key)
+        with open(tmp_path, 'wb') as body_file:
+            body_file.write(body)
+        self._commit(key, tmp_path, self._response_meta(response), len(body))
+
+    @staticmethod
+    def _add_validators(meta: Optional[dict], headers: dict):
+        """Turn a stale entry into a conditional request."""
+        if meta is None:
+            return
+        cached_headers = CaseInsensitiveDict(meta["headers"])
+        if 'ETag' in cached_headers:
+            headers['If-None-Match'] = cached_headers['ETag']
+        if 'Last-Modified' in cached_headers:
+            headers['If-Modified-Since'] = cached_headers['Last-Modified']
+
+    def _revalidate(self, key: str, meta: dict, response: requests.Response):
+        """Mark an entry fresh again after a 304 Not Modified."""
+        meta["stored_at"] = time.time()
+        meta["headers"].update({k: v for k, v in response.headers.items() if k.lower() not in SKIPPED_HEADERS})
+        self._write_meta(key, meta)
+        self._touch(key)
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits into max_bytes."""
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+            target = self.max_bytes * 0.9
+            victims = []
+            for key, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+                if self._total_bytes <= target:
+                    break
+                victims.append(key)
+                self._total_bytes -= size
+                del self._index[key]
+        for key in victims:
+            for path in self._paths(key):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _build_response(meta: dict, body: bytes, url: str) -> requests.Response:
+        response = requests.Response()
+        response.status_code = meta["status"]
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response._content = body
+        response.encoding = meta.get("encoding")
+        response.url = url
+        response.from_cache = True
+        return response
+
+    def get(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+            ttl: Optional[float] = None, **kwargs) -> requests.Response:
+        """
+        Send a GET request through the cache.
+        :param url: Request URL
+        :param params: Query parameters
+        :param headers: Request headers
+        :param ttl: Override of the per-host time to live, 0 always revalidates
+        :param kwargs: Extra arguments for http_get, e.g. timeout
+        :return: Response, from_cache is True when no body was downloaded
+        """
+        with span("http_cache", urlsplit(url).hostname or "") as record:
+            response = self._get(url, params, headers, ttl, **kwargs)
+            record["bytes"] = len(response.content)
+            return response
+
+    def _get(self, url: str, params: Optional[dict], headers: Optional[dict], ttl: Optional[float],
+             **kwargs) -> requests.Response:
+        url = normalize_url(url, params)
+        headers = dict(headers or {})
+        key = self.cache_key(url, headers)
+        ttl = self.ttl_for(url) if ttl is None else ttl
+        with self._lock:
+            self._load_index()
+
+        meta, body = self._read(key)
+        if meta is not None and time.time() - meta["stored_at"] < ttl:
+            self._touch(key)
+            annotate(cache_hit=True)
+            return self._build_response(meta, body, url)
+
+        self._add_validators(meta, headers)
+        response = http_get(url, headers=headers, **kwargs)
+
+        if response.status_code == 304 and meta is not None:
+            self._revalidate(key, meta, response)
+            annotate(cache_hit=True, revalidated=True)
+            return self._build_response(meta, body, url)
+
+        annotate(cache_hit=False, status=response.status_code)
+        response.from_cache = False
+        if response.status_code == 200 and 'no-store' not in response.headers.get('Cache-Control', ''):
+            self._store(key, response)
+        return response
+
+    def fetch_file(self, url: str, headers: Optional[dict] = None, ttl: Optional[float] = None,
+                   max_bytes: Optional[int] = None, chunk_size: int = 1024 * 1024, **kwargs) -> str:
+        """
+        Download a response body into the cache in chunks, without holding it in memory.
+        :param url: Request URL
+        :param headers: Request headers
+        :param ttl: Override of the per-host time to live
+        :param max_bytes: Abort the download once the body is larger than this
+        :param chunk_size: Bytes read from the socket at a time
+        :param kwargs: Extra arguments for http_get, e.g. timeout
+        :return: Path of the cached body, it stays readable after eviction while it is open
+        """
+        with span("http_cache", urlsplit(url).hostname or "", stream=True):
+            return self._fetch_file(url, headers, ttl, max_bytes, chunk_size, **kwargs)
+
+    def _fetch_file(self, url: str, headers: Optional[dict], ttl: Optional[float], max_bytes: Optional[int],
+                    chunk_size: int, **kwargs) -> str:
+        url = normalize_url(url)
+        headers = dict(headers or {})
+        key = self.cache_key(url, headers)
+        ttl = self.ttl_for(url) if ttl is None else ttl
+        with self._lock:
+            self._load_index()
+        body_path = self._paths(key)[1]
+
+        meta = self._read_meta(key)
+        if meta is not None and max_bytes is not None and os.path.getsize(body_path) > max_bytes:
+            raise ResponseTooLarge(f"{url} is larger than {max_bytes} bytes")
+        if meta is not None and time.time() - meta["stored_at"] < ttl:
+            self._touch(key)
+            annotate(cache_hit=True, bytes=os.path.getsize(body_path))
+            return body_path
+
+        self._add_validators(meta, headers)
+        with http_get(url, headers=headers, stream=True, **kwargs) as response:
+            if response.status_code == 304 and meta is not None:
+                self._revalidate(key, meta, response)
+                annotate(cache_hit=True, revalidated=True, bytes=os.path.getsize(body_path))
+                return body_path
+            response.raise_for_status()
+            tmp_path = self._tmp_body_path(key)
+            try:
+                size = stream_to_file(response, tmp_path, max_bytes, chunk_size)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._commit(key, tmp_path, self._response_meta(response), size)
+        annotate(cache_hit=False, bytes=size)
+        return body_path
+
+
+class ResponseTooLarge(requests.exceptions.RequestException):
+    """Raised when a streamed response exceeds its size limit."""
+
+
+def stream_to_file(response: requests.Response, path: str, max_bytes: Optional[int] = None,
+                   chunk_size: int = 1024 * 1024) -> int:
+    """
+    Write a streamed response body to a file.
+
+    Args:
+        response (requests.Response): Response opened with stream=True
+        path (str): Destination file
+        max_bytes (int): Abort once the body is larger than this, None for no limit
+        chunk_size (int): Bytes read from the socket at a time
+
+    Returns:
+        int: Number of bytes written
+    """
+    declared = response.headers.get('Content-Length')
+    if max_bytes is not None and declared is not None and int(declared) > max_bytes:
+        raise ResponseTooLarge(f"{response.url} is {declared} bytes, limit is {max_bytes}")
+    size = 0
+    with open(path, 'wb') as body_file:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise ResponseTooLarge(f"{response.url} is larger than {max_bytes} bytes")
+            body_file.write(chunk)
+    return size
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> HttpCache:
+    """Return the process-wide HTTP cache."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = HttpCache()
+        return _default_cache
+
+
+def cached_get(url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+               **kwargs) -> requests.Response:
+    """
+    Drop-in replacement for requests.get that goes through the shared HTTP cache.
+
+    Args:
+        url (str): Request URL
+        params (dict): Query parameters
+        headers (dict): Request headers
+        **kwargs: Extra arguments, see HttpCache.get
+
+    Returns:
+        requests.Response: Cached or freshly downloaded response
+    """
+    if HTTP_CACHE_DISABLED:
+        return http_get(url, params=params, headers=headers, **kwargs)
+    return get_http_cache().get(url, params=params, headers=headers, **kwargs)
+
+
+@contextmanager
+def download_to_file(url: str, max_bytes: Optional[int] = None, **kwargs) -> Iterator[str]:
+    """
+    Stream a download to disk and yield the file path, through the shared HTTP cache when it is enabled.
+
+    Args:
+        url (str): Request URL
+        max_bytes (int): Abort the download once the body is larger than this
+        **kwargs: Extra arguments, see HttpCache.fetch_file
+
+    Returns:
+        Iterator[str]: Path of the downloaded body, valid inside the with block
+    """
+    if not HTTP_CACHE_DISABLED:
+        yield get_http_cache().fetch_file(url, max_bytes=max_bytes, **kwargs)
+        return
+    kwargs.pop("ttl", None)
+    fd, path = tempfile.mkstemp(suffix='.download')
+    os.close(fd)
+    try:
+        with http_get(url, stream=True, **kwargs) as response:
+            response.raise_for_status()
+            stream_to_file(response, path, max_bytes)
+        yield path
+    finally:
+        os.unlink(path)
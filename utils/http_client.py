@@ -0,0 +1,211 @@
+"""
+This module contains the shared HTTP client used for every outbound request.
+
+It keeps connections alive in a pooled session, limits concurrent requests per host, spaces the
+requests to hosts that ask for it, applies a default timeout and retries 429 and 5xx responses with
+jittered exponential backoff, honoring Retry-After when the server sends it.
+"""
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.tracing import span
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "8"))
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 30.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Minimum seconds between the requests of this process to a host,
+# arXiv asks API clients for at most one request every three seconds
+HOST_REQUEST_INTERVALS = {
+    "export.arxiv.org": float(os.getenv("ARXIV_REQUEST_INTERVAL", "3")),
+}
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """
+    Read the Retry-After header of a response.
+
+    Args:
+        response (requests.Response): Response with status 429 or 503
+
+    Returns:
+        float: Seconds to wait, None if the header is missing or invalid
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """
+    Pooled, rate-limited HTTP client with retries.
+    """
+
+    def __init__(self, timeout: float = HTTP_TIMEOUT, max_retries: int = HTTP_MAX_RETRIES,
+                 per_host_limit: int = HTTP_PER_HOST_LIMIT, host_intervals: Optional[Dict[str, float]] = None):
+        """
+        Initialize the client.
+        :param timeout: Default connect and read timeout in seconds
+        :param max_retries: Retries of failed requests, 0 disables retrying
+        :param per_host_limit: Maximum number of concurrent requests to one host
+        :param host_intervals: Minimum seconds between two requests per host, defaults to HOST_REQUEST_INTERVALS
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.per_host_limit = per_host_limit
+        self.host_intervals = HOST_REQUEST_INTERVALS if host_intervals is None else host_intervals
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=per_host_limit, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host_limit))
+        self._next_request = {}
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            return self._host_slots[urlsplit(url).hostname]
+
+    def wait_for_turn(self, url: str) -> float:
+        """
+        Reserve the next request time of a host with a request interval and sleep until it.
+        Only the reservation holds the lock, so waiting for one host does not delay the others.
+        :param url: Request URL
+        :return: Seconds waited
+        """
+        host = urlsplit(url).hostname
+        interval = self.host_intervals.get(host)
+        if not interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            turn = max(now, self._next_request.get(host, now))
+            self._next_request[host] = turn + interval
+        if turn > now:
+            time.sleep(turn - now)
+        return turn - now
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """
+        Jittered exponential backoff.
+        :param attempt: Number of the failed attempt, starting at 0
+        :return: Seconds to wait before the next attempt
+        """
+        return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request, retrying connection errors, 429 and 5xx responses.
+        :param method: HTTP method, only idempotent requests should be sent
+        :param url: Request URL
+        :param kwargs: Arguments of requests.request, timeout defaults to the client timeout
+        :return: Response of the last attempt
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        slot = self._slot(url)
+        with span("http", urlsplit(url).hostname or "", method=method) as record:
+            for attempt in range(self.max_retries + 1):
+                record["attempts"] = attempt + 1
+                waited = self.wait_for_turn(url)
+                if waited:
+                    record["waited"] = record.get("waited", 0.0) + waited
+                try:
+                    with slot:
+                        response = self.session.request(method, url, **kwargs)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if attempt == self.max_retries:
+                        raise
+                    time.sleep(self.backoff(attempt))
+                    continue
+
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    break
+                delay = retry_after_seconds(response)
+                response.close()
+                time.sleep(min(delay, HTTP_BACKOFF_MAX) if delay is not None else self.backoff(attempt))
+            record["status"] = response.status_code
+            # Streamed bodies are counted by the caller that reads them
+            if not kwargs.get('stream'):
+                record["bytes"] = len(response.content)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send a GET request.
+        :param url: Request URL
+        :param kwargs: Arguments of requests.get
+        :return: Response of the last attempt
+        """
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send a POST request, e.g. a GraphQL query.
+        :param url: Request URL
+        :param kwargs: Arguments of requests.post
+        :return: Response of the last attempt
+        """
+        return self.request('POST', url, **kwargs)
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Return the process-wide HTTP client."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient()
+        return _http_client
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """
+    Drop-in replacement for requests.get that uses the shared client.
+
+    Args:
+        url (str): Request URL
+        **kwargs: Arguments of requests.get
+
+    Returns:
+        requests.Response: Response of the last attempt
+    """
+    return get_http_client().get(url, **kwargs)
+
+
+def http_post(url: str, **kwargs) -> requests.Response:
+    """
+    Drop-in replacement for requests.post that uses the shared client.
+
+    Args:
+        url (str): Request URL
+        **kwargs: Arguments of requests.post
+
+    Returns:
+        requests.Response: Response of the last attempt
+    """
+    return get_http_client().post(url, **kwargs)
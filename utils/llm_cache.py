@@ -0,0 +1,136 @@
+"""
+This module contains a persistent cache for LLM completions.
+
+A completion is keyed by the model, the temperature, the prompt template and a hash of the content
+inserted into the template, so the same paper or README is only summarized once.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from utils.storage import cache_path, open_sqlite
+from utils.tracing import span
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+
+
+class CompletionCache:
+    """
+    SQLite backed completion cache with least recently used eviction and hit/miss counters.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        """
+        Initialize the completion cache.
+        :param path: Path of the SQLite database
+        :param max_entries: Number of completions kept, least recently used ones are evicted above it
+        """
+        self.path = path or cache_path("llm", "completions.sqlite")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        self._lock = threading.Lock()
+        self._db = open_sqlite(self.path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS completions ("
+                         "key TEXT PRIMARY KEY, completion TEXT NOT NULL,"
+                         " created_at REAL NOT NULL, last_access REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)")
+
+    @staticmethod
+    def make_key(model: str, temperature: float, template: str, content: str) -> str:
+        """
+        Build the cache key of a completion.
+        :param model: Model name
+        :param temperature: Sampling temperature
+        :param template: Prompt template without the content
+        :param content: Content inserted into the template
+        :return: Hex digest identifying the completion
+        """
+        content_hash = hashlib.sha256(content.encode('utf8')).hexdigest()
+        raw = json.dumps([model, float(temperature), template, content_hash])
+        return hashlib.sha256(raw.encode('utf8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a completion.
+        :param key: Key built by make_key
+        :return: Cached completion or None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT completion FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE completions SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, completion: str):
+        """
+        Store a completion and evict the least recently used ones above max_entries.
+        :param key: Key built by make_key
+        :param completion: Completion text
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                             (key, completion, now, now))
+            self._db.execute("DELETE FROM completions WHERE key IN ("
+                             "SELECT key FROM completions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                             (self.max_entries,))
+
+    def get_or_compute(self, model: str, temperature: float, template: str, content: str,
+                       compute: Callable[[], str], bypass: bool = False) -> str:
+        """
+        Return the cached completion or compute and store it.
+        :param model: Model name
+        :param temperature: Sampling temperature
+        :param template: Prompt template without the content
+        :param content: Content inserted into the template
+        :param compute: Callable that calls the LLM
+        :param bypass: Skip the cache lookup and do not store the result
+        :return: Completion text
+        """
+        with span("llm", model) as record:
+            record["cache_hit"] = False
+            if bypass or LLM_CACHE_BYPASS:
+                with self._lock:
+                    self.bypassed += 1
+                return compute()
+            key = self.make_key(model, temperature, template, content)
+            completion = self.get(key)
+            if completion is not None:
+                record["cache_hit"] = True
+                return completion
+            completion = compute()
+            if completion:
+                self.put(key, completion)
+            return completion
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache counters of this process.
+        :return: Dictionary with hits, misses, bypassed and the number of stored entries
+        """
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "bypassed": self.bypassed, "entries": entries}
+
+
+_completion_cache = None
+_completion_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> CompletionCache:
+    """Return the process-wide completion cache."""
+    global _completion_cache
+    with _completion_cache_lock:
+        if _completion_cache is None:
+            _completion_cache = CompletionCache()
+        return _completion_cache
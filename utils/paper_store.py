@@ -0,0 +1,65 @@
+"""
+This module contains a local store of parsed papers, so every PDF is downloaded and parsed only once.
+"""
+import json
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Union
+
+from utils.storage import cache_path, open_sqlite
+
+
+class PaperStore:
+    """
+    SQLite store of extracted paper text (zlib compressed) and git links, keyed by arXiv ID.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the paper store.
+        :param path: Path of the SQLite database
+        """
+        self.path = path or cache_path("papers", "papers.sqlite")
+        self._lock = threading.Lock()
+        self._db = open_sqlite(self.path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS papers ("
+                         "paper_id TEXT PRIMARY KEY, text BLOB NOT NULL, links TEXT NOT NULL,"
+                         " stored_at REAL NOT NULL)")
+
+    def get(self, paper_id: str) -> Optional[Dict[str, Union[str, List[str]]]]:
+        """
+        Load a parsed paper.
+        :param paper_id: arXiv ID or normalized PDF URL
+        :return: Dictionary with text and links, None if the paper was never parsed
+        """
+        with self._lock:
+            row = self._db.execute("SELECT text, links FROM papers WHERE paper_id = ?", (paper_id,)).fetchone()
+        if row is None:
+            return None
+        return {"text": zlib.decompress(row[0]).decode('utf8'), "links": json.loads(row[1])}
+
+    def put(self, paper_id: str, text: str, links: List[str]):
+        """
+        Save a parsed paper.
+        :param paper_id: arXiv ID or normalized PDF URL
+        :param text: Extracted text
+        :param links: Extracted git links
+        """
+        compressed = zlib.compress(text.encode('utf8'), 6)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?)",
+                             (paper_id, compressed, json.dumps(links), time.time()))
+
+
+_paper_store = None
+_paper_store_lock = threading.Lock()
+
+
+def get_paper_store() -> PaperStore:
+    """Return the process-wide paper store."""
+    global _paper_store
+    with _paper_store_lock:
+        if _paper_store is None:
+            _paper_store = PaperStore()
+        return _paper_store
@@ -1,13 +1,125 @@
 """
 This module contains a class to download
 """
-import io
+import mmap
+import multiprocessing
+import os
 import re
-from typing import Dict, List, Union
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
 
-import PyPDF2
 import requests
 
+from utils.http_cache import download_to_file
+from utils.paper_store import get_paper_store
+from utils.tracing import annotate, span
+
+if TYPE_CHECKING:
+    import PyPDF2
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "200"))
+PDF_TIME_BUDGET = float(os.getenv("PDF_TIME_BUDGET", "120"))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(50 * 1024 * 1024)))
+# Below this many pages the process pool costs more than it saves
+PARALLEL_MIN_PAGES = 8
+
+# Sections kept by the selective extraction mode
+DEFAULT_SECTIONS = ('abstract', 'introduction', 'method', 'conclusion')
+SECTION_TITLES = {
+    'abstract': ('abstract',),
+    'introduction': ('introduction', 'background'),
+    'method': ('method', 'methods', 'methodology', 'approach', 'our approach', 'proposed method',
+               'proposed approach', 'model', 'framework'),
+    'conclusion': ('conclusion', 'conclusions', 'discussion', 'conclusion and future work',
+                   'conclusions and future work', 'discussion and conclusion', 'summary'),
+}
+# Sections dropped by the selective extraction mode, other numbered sections are kept as method
+SKIPPED_TITLES = ('related work', 'related works', 'prior work', 'previous work', 'literature review',
+                  'experiment', 'experiments', 'experimental results', 'experimental setup',
+                  'experimental evaluation', 'experiments and results')
+# Everything after one of these headings is dropped
+TAIL_TITLES = ('references', 'bibliography', 'acknowledgements', 'acknowledgments', 'acknowledgement',
+               'acknowledgment', 'appendix', 'appendices', 'supplementary material')
+_HEADING = re.compile(r'^(?:(?P<number>\d+(?:\.\d+)*|[IVX]+|[A-H])\.?\s+)?(?P<title>[A-Z][A-Za-z &\-]{2,60})$')
+_INLINE_ABSTRACT = re.compile(r'^abstract\b\s*[\-\u2014:.]?\s*(?P<rest>\S.*)$', re.IGNORECASE)
+_BOILERPLATE = re.compile(r'^(?:\d{1,3}|arXiv:\d{4}\.\d{4,5}\S*.*|Preprint\..*|Under review.*)$')
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, because the pool is created from worker threads of the task intake
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool, the next parse starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _page_uris(page: "PyPDF2.PageObject") -> List[str]:
+    """Read the targets of URI link annotations on a page."""
+    uris = []
+    try:
+        for annotation in page.get('/Annots') or []:
+            action = annotation.get_object().get('/A')
+            if action is None:
+                continue
+            uri = action.get_object().get('/URI')
+            if uri:
+                uris.append(str(uri))
+    except Exception as e:
+        print(f"Skipping malformed link annotations: {e}")
+    return uris
+
+
+def _extract_pages(reader: "PyPDF2.PdfReader", start: int, stop: int,
+                   deadline: float) -> Tuple[List[str], List[str]]:
+    """
+    Extract the text and link annotation URIs of pages [start, stop),
+    stopping early once the deadline has passed.
+    """
+    texts, uris = [], []
+    for index in range(start, stop):
+        if time.time() > deadline:
+            break
+        page = reader.pages[index]
+        texts.append(page.extract_text())
+        uris.extend(_page_uris(page))
+    return texts, uris
+
+
+@contextmanager
+def _map_pdf(pdf_path: str) -> Iterator[mmap.mmap]:
+    """Open a PDF file as a read-only memory-mapped view."""
+    with open(pdf_path, 'rb') as pdf_file:
+        view = mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield view
+    finally:
+        view.close()
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int, deadline: float) -> Tuple[List[str], List[str]]:
+    """Process pool entry point, every worker maps and parses the document on its own."""
+    import PyPDF2
+
+    with _map_pdf(pdf_path) as view:
+        return _extract_pages(PyPDF2.PdfReader(view), start, stop, deadline)
+
 
 class PDFParser:
     """
@@ -51,21 +163,198 @@ class PDFParser:
 
         return None
 
+    @classmethod
+    def paper_id(cls, url: str) -> Optional[str]:
+        """
+        Get the identifier a paper is stored under.
+
+        Args:
+            url (str): Input ArXiv or PDF link
+
+        Returns:
+            str: ArXiv ID without version, the normalized PDF link for other PDFs, None if invalid
+        """
+        normalized = cls.normalize_arxiv_link(url)
+        if normalized is None:
+            return None
+        match = re.search(r'arxiv\.org/pdf/([0-9]{4}\.[0-9]{4,5})(?:v\d+)?(?:\.pdf)?$', normalized)
+        if match:
+            return match.group(1)
+        return normalized
+
+    @contextmanager
+    def open_pdf(self, max_bytes: int = PDF_MAX_BYTES) -> Iterator[str]:
+        """
+        Stream the PDF to a file in chunks and yield its path.
+
+        Args:
+            max_bytes (int): Abort the download once the document is larger than this
+
+        Returns:
+            Iterator[str]: Path of the downloaded PDF, valid inside the with block
+        """
+        url = self.normalize_arxiv_link(self.pdf_url)
+        with download_to_file(url, max_bytes=max_bytes) as pdf_path:
+            yield pdf_path
+
     def download_pdf(self) -> bytes:
         """Download PDF content from URL."""
-        url = self.normalize_arxiv_link(self.pdf_url)
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.content
+        with self.open_pdf() as pdf_path, open(pdf_path, 'rb') as pdf_file:
+            return pdf_file.read()
+
+    @staticmethod
+    def _extract_parallel(pdf_path: str, page_count: int, deadline: float) -> Tuple[List[str], List[str]]:
+        """Extract page ranges in the process pool, a pool broken by a dying worker is replaced once."""
+        step = -(-page_count // PDF_WORKERS)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        for attempt in range(2):
+            pool = _get_pool()
+            try:
+                futures = [pool.submit(_extract_page_range, pdf_path, start, stop, deadline)
+                           for start, stop in ranges]
+                wait(futures, timeout=max(deadline - time.time(), 0) + 1)
+
+                # Keep pages in order and stop at the first range that ran out of time
+                texts, uris = [], []
+                for future, (start, stop) in zip(futures, ranges):
+                    if not future.done():
+                        break
+                    part_texts, part_uris = future.result()
+                    texts.extend(part_texts)
+                    uris.extend(part_uris)
+                    if len(part_texts) < stop - start:
+                        break
+                for future in futures:
+                    future.cancel()
+                return texts, uris
+            except BrokenProcessPool:
+                _discard_pool(pool)
+                if attempt:
+                    raise
+                print("PDF worker process died, restarting the pool")
+
+    @classmethod
+    def extract_text_and_uris(cls, pdf_path: str, parallel: bool = True, max_pages: int = PDF_MAX_PAGES,
+                              time_budget: float = PDF_TIME_BUDGET) -> Tuple[str, List[str]]:
+        """
+        Extract text and link annotation URIs from PDF content,
+        optionally splitting page ranges across a process pool.
+
+        Args:
+            pdf_path (str): PDF file, it is memory-mapped rather than read into memory
+            parallel (bool): Use the process pool for documents with many pages
+            max_pages (int): Maximum number of pages extracted, 0 for no limit
+            time_budget (float): Seconds after which extraction stops and the pages read so far are returned
+
+        Returns:
+            Tuple[str, List[str]]: Text of the extracted pages, one page per line block, and link URIs
+        """
+        text, uris, _ = cls.extract_document(pdf_path, parallel, max_pages, time_budget)
+        return text, uris
+
+    @classmethod
+    def extract_document(cls, pdf_path: str, parallel: bool = True, max_pages: int = PDF_MAX_PAGES,
+                         time_budget: float = PDF_TIME_BUDGET) -> Tuple[str, List[str], bool]:
+        """
+        Extract text and link annotation URIs, see extract_text_and_uris.
+
+        Returns:
+            Tuple[str, List[str], bool]: Text, link URIs and whether all pages up to max_pages were read
+                before the time budget ran out
+        """
+        import PyPDF2
+
+        deadline = time.time() + time_budget
+        with _map_pdf(pdf_path) as view:
+            reader = PyPDF2.PdfReader(view)
+            page_count = len(reader.pages)
+            if max_pages:
+                page_count = min(page_count, max_pages)
+            serial = not parallel or PDF_WORKERS < 2 or page_count < PARALLEL_MIN_PAGES
+            if serial:
+                texts, uris = _extract_pages(reader, 0, page_count, deadline)
+
+        if not serial:
+            texts, uris = cls._extract_parallel(pdf_path, page_count, deadline)
+
+        complete = len(texts) == page_count
+        if not complete:
+            print(f"PDF extraction budget reached after {len(texts)} of {page_count} pages")
+        annotate(pages=len(texts), parallel=not serial, complete=complete)
+        return "".join(f"{text}\n" for text in texts), uris, complete
+
+    @classmethod
+    def extract_text(cls, pdf_path: str, parallel: bool = True, max_pages: int = PDF_MAX_PAGES,
+                     time_budget: float = PDF_TIME_BUDGET) -> str:
+        """Extract text from PDF content, see extract_text_and_uris."""
+        return cls.extract_text_and_uris(pdf_path, parallel, max_pages, time_budget)[0]
 
     def extract_text_from_pdf(self) -> str:
         """Extract text from PDF content."""
-        pdf_file = io.BytesIO(self.download_pdf())
-        reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        with self.open_pdf() as pdf_path:
+            return self.extract_text(pdf_path)
+
+    @staticmethod
+    def _classify_heading(line: str) -> Optional[str]:
+        """
+        Map a heading line to a section name, 'tail' for references and appendices, 'skipped' for related work
+        and experiments, 'subsection' for numbered subsections, None if it is no heading.
+        """
+        match = _HEADING.match(line)
+        if not match:
+            return None
+        title = match.group('title').strip().lower()
+        if title in TAIL_TITLES:
+            return 'tail'
+        number = match.group('number')
+        if number and ('.' in number or number in 'ABCDEFGH'):
+            return 'subsection'
+        if title in SKIPPED_TITLES:
+            return 'skipped'
+        for section, titles in SECTION_TITLES.items():
+            if title in titles:
+                return section
+        # Other numbered sections are the body of the paper, e.g. "3 Model Architecture"
+        return 'method' if number else None
+
+    @classmethod
+    def select_sections(cls, text: str, sections=DEFAULT_SECTIONS) -> str:
+        """
+        Keep only the given sections of a paper and drop references, appendices and page boilerplate.
+
+        Args:
+            text (str): Extracted paper text
+            sections (tuple): Section names to keep, see SECTION_TITLES
+
+        Returns:
+            str: Selected sections, or the text up to the references if no section heading was found
+        """
+        kept, body = [], []
+        current, found = None, False
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line or _BOILERPLATE.match(line):
+                continue
+            inline_abstract = _INLINE_ABSTRACT.match(line) if current is None else None
+            heading = 'abstract' if inline_abstract else cls._classify_heading(line)
+            if heading == 'tail':
+                break
+            if heading == 'subsection':
+                # Subsections belong to the section they are in
+                if current in sections:
+                    kept.append(f"\n{line}")
+                continue
+            if heading is not None:
+                current, found = heading, found or heading in SECTION_TITLES
+                if inline_abstract:
+                    kept.append(inline_abstract.group('rest'))
+                elif current in sections:
+                    kept.append(f"\n{line}")
+                continue
+            body.append(line)
+            if current in sections:
+                kept.append(line)
+        return "\n".join(kept if found else body)
 
     @staticmethod
     def extract_git_links(text: str) -> List[str]:
@@ -90,20 +379,45 @@ class PDFParser:
 
         return unique_links
 
-    def process_pdf_url(self) -> Dict[str, Union[str, List[str]]]:
-        """Process PDF URL and return text and Git links."""
+    def process_pdf_url(self, selective: bool = False) -> Dict[str, Union[str, List[str]]]:
+        """
+        Process PDF URL and return text and Git links.
+
+        Args:
+            selective (bool): Return only the main sections of the paper, see select_sections
+
+        Returns:
+            Dict[str, Union[str, List[str]]]: Text and Git links of the paper
+        """
+        paper_id = self.paper_id(self.pdf_url)
+        with span("pdf", paper_id or self.pdf_url) as record:
+            result = get_paper_store().get(paper_id) if paper_id is not None else None
+            record["cache_hit"] = result is not None
+            if result is None:
+                result = self._parse_pdf(paper_id)
+            record["chars"] = len(result["text"])
+        if selective:
+            result["text"] = self.select_sections(result["text"])
+        return result
+
+    def _parse_pdf(self, paper_id: Optional[str]) -> Dict[str, Union[str, List[str]]]:
+        """Download and parse the PDF and save the result to the paper store."""
         try:
             # Extract text
-            text = self.extract_text_from_pdf()
+            with self.open_pdf() as pdf_path:
+                text, uris, complete = self.extract_document(pdf_path)
 
-            # Extract Git links
-            links = self.extract_git_links(text)
+            # Extract Git links, link annotations are exact so the text is only searched without them
+            links = self.extract_git_links("\n".join(uris)) or self.extract_git_links(text)
 
             # Create result dictionary
             result = {
                 "text": text,
                 "links": links
             }
+            # Text cut short by the time budget is used once but parsed again next time
+            if paper_id is not None and complete and text.strip():
+                get_paper_store().put(paper_id, text, links)
 
             return result
 
@@ -111,3 +425,27 @@ class PDFParser:
             raise Exception(f"Error downloading PDF: {str(e)}")
         except Exception as e:
             raise Exception(f"Error processing PDF: {str(e)}")
+
+
+def _benchmark(pdf_path: str):
+    import PyPDF2
+
+    pages = min(len(PyPDF2.PdfReader(pdf_path).pages), PDF_MAX_PAGES)
+    PDFParser.extract_text(pdf_path, parallel=True)  # start the process pool outside the measurement
+    for mode in (False, True):
+        started = time.perf_counter()
+        PDFParser.extract_text(pdf_path, parallel=mode)
+        elapsed = time.perf_counter() - started
+        print(f"{'parallel' if mode else 'serial'}: {pages} pages in {elapsed:.2f}s,"
+              f" {pages / elapsed:.1f} pages/s")
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Extraction throughput: python -m utils.pdf_parser https://arxiv.org/abs/2403.19971 (or a local file)
+    if os.path.exists(sys.argv[1]):
+        _benchmark(sys.argv[1])
+    else:
+        with PDFParser(sys.argv[1]).open_pdf() as downloaded_path:
+            _benchmark(downloaded_path)
@@ -0,0 +1,36 @@
+"""
+This module contains timing of the worker startup phases.
+"""
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# The clock starts when app.py imports this module
+_PROCESS_START = time.perf_counter()
+_phases = []
+
+
+@contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    """
+    Measure one startup phase.
+
+    Args:
+        name (str): Name of the phase in the report
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - start))
+
+
+def startup_report() -> str:
+    """
+    Summarize the startup phases measured so far.
+
+    Returns:
+        str: Duration of every phase and the time since the process started
+    """
+    phases = ''.join(f"{name} {seconds:.2f} s, " for name, seconds in _phases)
+    return f"Startup: {phases}total {time.perf_counter() - _PROCESS_START:.2f} s"
@@ -0,0 +1,53 @@
+"""
+This module contains helpers shared by the on-disk caches and stores.
+"""
+import os
+import sqlite3
+
+CACHE_ROOT = os.getenv("JASS_CACHE_DIR", "/tmp/jass/cache")
+
+
+def cache_path(*parts: str) -> str:
+    """
+    Build a path inside the cache root and make sure its parent directory exists.
+
+    Args:
+        *parts (str): Path components relative to the cache root
+
+    Returns:
+        str: Absolute path inside the cache root
+    """
+    path = os.path.join(CACHE_ROOT, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def cache_dir(*parts: str) -> str:
+    """
+    Build a directory path inside the cache root and create it.
+
+    Args:
+        *parts (str): Path components relative to the cache root
+
+    Returns:
+        str: Absolute directory path inside the cache root
+    """
+    path = os.path.join(CACHE_ROOT, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def open_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite database that is shared between threads and processes.
+
+    Args:
+        path (str): Database file path
+
+    Returns:
+        sqlite3.Connection: Connection in WAL mode, usable from any thread
+    """
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
@@ -0,0 +1,214 @@
+"""
+This module contains the claim/lease protocol that lets several agent replicas share one research volume.
+
+Every task is claimed by creating a lock file with O_CREAT | O_EXCL, so only one replica wins.
+The owner keeps the lease alive by touching the lock file; a replica that dies stops heartbeating
+and its lease expires, after which another replica may take the task over.
+Finished tasks are appended to a journal so restarts never run them again. Failed attempts are
+journaled as well, so every replica sees how often a task failed and when it was last tried.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Set, Tuple
+
+# Journal status of a failed attempt, the task stays pending
+ATTEMPT_FAILED = "attempt_failed"
+
+
+class TaskClaims:
+    """
+    Durable, multi-replica task claiming on a shared directory.
+    """
+
+    def __init__(self, volume: str, lease_seconds: float = 120.0, owner: Optional[str] = None):
+        """
+        Initialize the claim store.
+        :param volume: Shared research volume
+        :param lease_seconds: Time after which a lease without heartbeat is considered abandoned
+        :param owner: Identifier of this replica, defaults to hostname and pid
+        """
+        self.claims_dir = os.path.join(volume, ".claims")
+        self.journal_path = os.path.join(self.claims_dir, "completed.jsonl")
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        os.makedirs(self.claims_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._held: Set[str] = set()
+        self._completed: Dict[str, str] = {}
+        self._failures: Dict[str, Tuple[int, float]] = {}
+        self._journal_offset = 0
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat = None
+
+    def _lock_path(self, task_id: str) -> str:
+        return os.path.join(self.claims_dir, f"{task_id}.lock")
+
+    def _is_stale(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) > self.lease_seconds
+        except FileNotFoundError:
+            return False
+
+    def _refresh_journal(self):
+        """Read journal lines appended by any replica since the last refresh."""
+        try:
+            with open(self.journal_path, 'rb') as journal:
+                journal.seek(self._journal_offset)
+                data = journal.read()
+        except FileNotFoundError:
+            return
+        # Only consume complete lines, a concurrent writer may be in the middle of one
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == ATTEMPT_FAILED:
+                count, _ = self._failures.get(record["task_id"], (0, 0.0))
+                self._failures[record["task_id"]] = (count + 1, record.get("finished_at", 0.0))
+            else:
+                self._completed[record["task_id"]] = record.get("status", "done")
+        self._journal_offset += end
+
+    def is_completed(self, task_id: str) -> bool:
+        """
+        Check whether any replica has finished the task.
+        :param task_id: Research task id
+        :return: True if the task is recorded in the journal
+        """
+        with self._lock:
+            self._refresh_journal()
+            return task_id in self._completed
+
+    def failures(self, task_id: str) -> Tuple[int, float]:
+        """
+        Get the failed attempts of a task over all replicas.
+        :param task_id: Research task id
+        :return: Number of failed attempts and the time of the last one, (0, 0.0) if it never failed
+        """
+        with self._lock:
+            self._refresh_journal()
+            return self._failures.get(task_id, (0, 0.0))
+
+    def _break_stale_lock(self, path: str) -> bool:
+        """
+        Remove an expired lock file. The lock is first renamed to a private name so only one
+        replica can break it; if it turns out to be fresh again it is put back.
+        """
+        private_path = f"{path}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(path, private_path)
+        except FileNotFoundError:
+            return False
+        if not self._is_stale(private_path):
+            # Another replica re-claimed the task in between, restore its lock
+            try:
+                os.link(private_path, path)
+            except FileExistsError:
+                pass
+            os.unlink(private_path)
+            return False
+        os.unlink(private_path)
+        return True
+
+    def try_claim(self, task_id: str) -> bool:
+        """
+        Try to take the lease for a task.
+        :param task_id: Research task id
+        :return: True if this replica now owns the task
+        """
+        if self.is_completed(task_id):
+            return False
+        path = self._lock_path(task_id)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if self._is_stale(path) and self._break_stale_lock(path):
+                    print(f"Lease for task {task_id} expired, taking it over")
+                    continue
+                return False
+            with os.fdopen(fd, 'w') as lock_file:
+                json.dump({"owner": self.owner, "claimed_at": time.time()}, lock_file)
+            with self._lock:
+                self._held.add(task_id)
+            # The journal may have been written between the check above and the claim
+            if self.is_completed(task_id):
+                self.release(task_id)
+                return False
+            return True
+        return False
+
+    def release(self, task_id: str):
+        """
+        Give up the lease without marking the task as completed.
+        :param task_id: Research task id
+        """
+        with self._lock:
+            if task_id not in self._held:
+                return
+            self._held.discard(task_id)
+        try:
+            os.unlink(self._lock_path(task_id))
+        except FileNotFoundError:
+            pass
+
+    def _append(self, task_id: str, status: str):
+        record = {"task_id": task_id, "status": status, "owner": self.owner, "finished_at": time.time()}
+        line = (json.dumps(record) + "\n").encode("utf8")
+        # A single O_APPEND write keeps lines from different replicas from interleaving
+        fd = os.open(self.journal_path, os.O_CREAT | os.O_APPEND | os.O_WRONLY, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def complete(self, task_id: str, status: str = "done"):
+        """
+        Record the task in the journal and release its lease.
+        :param task_id: Research task id
+        :param status: Final status, e.g. done or failed
+        """
+        self._append(task_id, status)
+        self.release(task_id)
+
+    def record_failure(self, task_id: str) -> int:
+        """
+        Record a failed attempt and release the lease, so the task can be retried by any replica.
+        :param task_id: Research task id
+        :return: Number of failed attempts including this one
+        """
+        self._append(task_id, ATTEMPT_FAILED)
+        self.release(task_id)
+        return self.failures(task_id)[0]
+
+    def _heartbeat_loop(self):
+        while not self._heartbeat_stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                held = list(self._held)
+            for task_id in held:
+                try:
+                    os.utime(self._lock_path(task_id))
+                except FileNotFoundError:
+                    print(f"Lost lease for task {task_id}")
+
+    def start_heartbeat(self):
+        """Start the background thread that keeps held leases alive."""
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat",
+                                               daemon=True)
+            self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        """Stop the heartbeat thread."""
+        if self._heartbeat is not None:
+            self._heartbeat_stop.set()
+            self._heartbeat.join()
+            self._heartbeat = None
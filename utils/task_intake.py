@@ -0,0 +1,195 @@
+"""
+This module contains the intake engine that picks up research tasks from the shared volume
+and runs them on a bounded worker pool.
+"""
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Set
+
+from utils.task_claims import TaskClaims
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional, polling is used instead
+    FileSystemEventHandler = object
+    Observer = None
+
+TASK_FILE_PATTERN = re.compile(r'^research_task_(.+)\.txt$')
+
+
+def task_id_from_filename(filename: str) -> Optional[str]:
+    """
+    Extract the task id from a task file name.
+
+    Args:
+        filename (str): Name of the file on the volume, e.g. research_task_42.txt
+
+    Returns:
+        str: Task id or None if the file is not a research task
+    """
+    match = TASK_FILE_PATTERN.match(os.path.basename(filename))
+    if match:
+        return match.group(1)
+    return None
+
+
+class _TaskFileEventHandler(FileSystemEventHandler):
+    """Wakes up the intake loop whenever a task file is written or moved into the volume."""
+
+    def __init__(self, wakeup: threading.Event):
+        super().__init__()
+        self.wakeup = wakeup
+
+    def _notify(self, path: str):
+        if task_id_from_filename(path) is not None:
+            self.wakeup.set()
+
+    def on_closed(self, event):
+        self._notify(event.src_path)
+
+    def on_moved(self, event):
+        self._notify(event.dest_path)
+
+
+class TaskIntake:
+    """
+    Watches the research volume for research_task_*.txt files and runs them concurrently.
+
+    File system events (inotify through watchdog) wake the intake loop as soon as a task
+    file appears. Without watchdog the volume is polled every poll_interval seconds.
+    Tasks are claimed through TaskClaims only while a worker is free, so several replicas can share
+    the volume and split its tasks. Failed tasks are retried after retry_delay, up to max_attempts times.
+    """
+
+    def __init__(self, volume: str, handler: Callable[[str, str, str], None],
+                 max_workers: int = 4, poll_interval: float = 2.0, rescan_interval: float = 30.0,
+                 claims: Optional[TaskClaims] = None, max_attempts: int = 3, retry_delay: float = 60.0):
+        """
+        Initialize the intake engine.
+        :param volume: Directory with research_task_*.txt files
+        :param handler: Callable taking (task_id, prompt, result_path) that runs one task
+        :param max_workers: Maximum number of research tasks running at once
+        :param poll_interval: Seconds between directory scans when file watching is unavailable
+        :param rescan_interval: Seconds between safety rescans when file watching is active
+        :param claims: Claim store shared with other replicas, defaults to one on the volume
+        :param max_attempts: Attempts of a failing task before it is journaled as failed
+        :param retry_delay: Seconds before a failed task is tried again
+        """
+        self.volume = volume
+        self.handler = handler
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
+        self.claims = claims or TaskClaims(volume)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="research-task")
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight: Set[str] = set()
+        self._observer = None
+
+    def _start_watcher(self) -> bool:
+        """Start the file system watcher, returns False if watching is unavailable."""
+        if Observer is None:
+            return False
+        try:
+            observer = Observer()
+            observer.schedule(_TaskFileEventHandler(self._wakeup), self.volume, recursive=False)
+            observer.start()
+        except OSError as e:
+            print(f"File watching unavailable, falling back to polling: {e}")
+            return False
+        self._observer = observer
+        return True
+
+    def _result_path(self, task_id: str) -> str:
+        return os.path.join(self.volume, f"research_result_{task_id}.txt")
+
+    def _run_task(self, task_id: str, file_path: str):
+        status = "failed"
+        try:
+            with open(file_path, 'r') as file:
+                prompt_content = file.read()
+            self.handler(task_id, prompt_content, self._result_path(task_id))
+            status = "done"
+        except Exception as e:
+            print(f"Research task {task_id} failed: {e}")
+        finally:
+            if status == "done":
+                self.claims.complete(task_id, status)
+            else:
+                # The lease is released, any replica may retry the task until it failed max_attempts times
+                attempts = self.claims.record_failure(task_id)
+                if attempts >= self.max_attempts:
+                    print(f"Research task {task_id} failed {attempts} times, giving up")
+                    self.claims.complete(task_id, status)
+            with self._lock:
+                self._in_flight.discard(task_id)
+            # A worker is free, pending tasks can be claimed now
+            self._wakeup.set()
+
+    def _try_claim(self, task_id: str) -> bool:
+        if self.claims.is_completed(task_id):
+            return False
+        attempts, last_failure = self.claims.failures(task_id)
+        if attempts and time.time() - last_failure < self.retry_delay:
+            return False
+        if os.path.exists(self._result_path(task_id)):
+            # Finished before the journal existed
+            self.claims.complete(task_id)
+            return False
+        return self.claims.try_claim(task_id)
+
+    def scan(self) -> int:
+        """
+        Claim pending task files found in the volume and submit them, as long as a worker is free.
+        Tasks beyond the free workers are left to other replicas or a later scan.
+        :return: Number of submitted tasks
+        """
+        submitted = 0
+        for filename in sorted(os.listdir(self.volume)):
+            task_id = task_id_from_filename(filename)
+            if task_id is None:
+                continue
+            with self._lock:
+                if len(self._in_flight) >= self.max_workers:
+                    break
+                if task_id in self._in_flight:
+                    continue
+            if not self._try_claim(task_id):
+                continue
+            with self._lock:
+                self._in_flight.add(task_id)
+            self._pool.submit(self._run_task, task_id, os.path.join(self.volume, filename))
+            submitted += 1
+        return submitted
+
+    def run_forever(self):
+        """Scan the volume and dispatch tasks until the process is stopped."""
+        self.claims.start_heartbeat()
+        watching = self._start_watcher()
+        interval = self.rescan_interval if watching else self.poll_interval
+        print(f"Watching {self.volume} ({'inotify' if watching else 'polling'}),"
+              f" up to {self.max_workers} concurrent tasks")
+        try:
+            while True:
+                self._wakeup.clear()
+                self.scan()
+                self._wakeup.wait(interval)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop the watcher and wait for running tasks to finish."""
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        self._pool.shutdown(wait=True)
+        self.claims.stop_heartbeat()
@@ -0,0 +1,55 @@
+"""
+This module contains token counting helpers shared by the summarization code.
+"""
+from functools import lru_cache
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    import tiktoken
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = "gpt-4o-mini") -> "tiktoken.Encoding":
+    """
+    Return the tokenizer of a model, loaded once per process.
+
+    Args:
+        model (str): Model name
+
+    Returns:
+        tiktoken.Encoding: Tokenizer of the model
+    """
+    import tiktoken
+
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Count the tokens of a text.
+
+    Args:
+        text (str): Text to count
+        model (str): Model whose tokenizer is used
+
+    Returns:
+        int: Number of tokens
+    """
+    return len(get_encoder(model).encode(text, disallowed_special=()))
+
+
+def split_text_by_tokens(long_text: str, chunk_size: int, model: str = "gpt-4o-mini") -> List[str]:
+    """
+    Split a long text into portions with a maximum number of tokens.
+
+    Args:
+        long_text (str): Long text to split
+        chunk_size (int): Number of tokens in each portion
+        model (str): Model whose tokenizer is used
+
+    Returns:
+        List[str]: Text portions
+    """
+    tokenizer = get_encoder(model)
+    tokens = tokenizer.encode(long_text, disallowed_special=())
+    return [tokenizer.decode(tokens[i:i + chunk_size]) for i in range(0, len(tokens), chunk_size)]
@@ -0,0 +1,131 @@
+"""
+This module contains the shaping of tool results before they are returned to the agent.
+
+Results are rendered as short indented "key: value" lines instead of Python reprs, long fields are cut
+and the whole output is kept within a per-tool token budget.
+"""
+import os
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+from utils.tokens import get_encoder
+
+TOOL_OUTPUT_TOKENS = int(os.getenv("TOOL_OUTPUT_TOKENS", "2000"))
+TOOL_FIELD_CHARS = int(os.getenv("TOOL_FIELD_CHARS", "500"))
+# Records with only scalar fields are rendered on one line up to this length
+INLINE_CHARS = 300
+
+
+def truncate_text(text: str, max_chars: Optional[int]) -> str:
+    """
+    Cut a text at a word boundary, whitespace is only collapsed when the text is cut.
+
+    Args:
+        text (str): Text of one field
+        max_chars (int): Maximum number of characters, None for no limit
+
+    Returns:
+        str: Text that ends with "..." if it was cut, otherwise the text with its line breaks
+    """
+    text = text.strip()
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    text = ' '.join(text.split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(' ', 1)[0] + "..."
+
+
+def _is_nested(value: Any) -> bool:
+    if isinstance(value, (list, tuple)):
+        # Lists of plain values, e.g. authors, stay on one line
+        return any(isinstance(item, (BaseModel, dict, list, tuple)) for item in value)
+    return isinstance(value, BaseModel) or (isinstance(value, dict) and len(value) > 0)
+
+
+def _scalar(value: Any, field_chars: Optional[int]) -> str:
+    if isinstance(value, float):
+        return f"{value:.3g}"
+    if isinstance(value, (list, tuple)) and value:
+        return truncate_text(', '.join(str(item) for item in value), field_chars)
+    if isinstance(value, (dict, list, tuple)):
+        return "none"
+    return truncate_text(str(value), field_chars)
+
+
+def _field(prefix: str, text: str, indent: str) -> str:
+    # Free text keeps its lines, continuation lines are indented below the field
+    first, *rest = text.split('\n')
+    return '\n'.join([prefix + first] + [indent + line if line.strip() else "" for line in rest])
+
+
+def render(value: Any, field_chars: Optional[int] = TOOL_FIELD_CHARS, indent: int = 0) -> str:
+    """
+    Render a tool result in a compact, stable text format.
+
+    Args:
+        value (Any): Text, number, pydantic model, or dict and list of them
+        field_chars (int): Maximum characters of every field, None for no limit
+        indent (int): Indentation level of nested values
+
+    Returns:
+        str: Short records with only scalar fields on one line, other values as indented lines
+    """
+    pad = '  ' * indent
+    if isinstance(value, BaseModel):
+        value = value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        if not any(_is_nested(item) for item in value.values()):
+            inline = '; '.join(f"{key}: {_scalar(item, field_chars)}" for key, item in value.items())
+            if len(inline) <= INLINE_CHARS and '\n' not in inline:
+                return pad + inline
+        lines = []
+        for key, item in value.items():
+            if _is_nested(item):
+                lines.append(f"{pad}{key}:")
+                lines.append(render(item, field_chars, indent + 1))
+            else:
+                lines.append(_field(f"{pad}{key}: ", _scalar(item, field_chars), pad + '  '))
+        return '\n'.join(lines)
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return pad + "none"
+        return '\n'.join(f"{pad}- {render(item, field_chars, indent + 1).lstrip()}" for item in value)
+    return _field(pad, _scalar(value, field_chars), pad)
+
+
+def fit_to_budget(text: str, max_tokens: int = TOOL_OUTPUT_TOKENS, model: str = "gpt-4o-mini") -> str:
+    """
+    Cut a text to a number of tokens.
+
+    Args:
+        text (str): Tool output
+        max_tokens (int): Token budget
+        model (str): Model whose tokenizer is used
+
+    Returns:
+        str: Text within the budget, with a note on how many tokens were cut
+    """
+    encoder = get_encoder(model)
+    tokens = encoder.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max_tokens]) + f"\n[truncated {len(tokens) - max_tokens} tokens]"
+
+
+def shape_output(title: str, value: Any, max_tokens: int = TOOL_OUTPUT_TOKENS,
+                 field_chars: Optional[int] = TOOL_FIELD_CHARS) -> str:
+    """
+    Render a tool result under a title and keep it within the token budget of the tool.
+
+    Args:
+        title (str): Short description of the result, e.g. "Result from google"
+        value (Any): Tool result
+        max_tokens (int): Token budget of the tool
+        field_chars (int): Maximum characters of every field, None for no limit
+
+    Returns:
+        str: Text returned to the agent
+    """
+    return fit_to_budget(f"{title}:\n{render(value, field_chars)}", max_tokens)
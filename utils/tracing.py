@@ -0,0 +1,256 @@
+"""
+This module contains per-task tracing of the hot paths.
+
+Tool calls, HTTP requests, PDF parsing, embedding batches and LLM calls are recorded as spans with their
+wall time, sizes, tokens and cache status. The spans of a task are appended to research_trace_{task_id}.jsonl
+next to its result file, `python -m utils.tracing <trace files or directories>` reports p50 and p95 per stage.
+"""
+import argparse
+import contextvars
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+TRACING = os.getenv("TRACING", "1") == "1"
+TRACE_PREFIX = "research_trace_"
+
+
+class TaskTrace:
+    """
+    JSONL file of the spans of one task, shared by all threads working on the task.
+    """
+
+    def __init__(self, task_id: str, path: str):
+        """
+        Initialize the trace.
+        :param task_id: Task ID written to every record
+        :param path: JSONL file, records are appended
+        """
+        self.task_id = task_id
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def write(self, stage: str, name: str, started_at: float, seconds: float, **fields):
+        """
+        Append one record.
+        :param stage: Stage, e.g. "http" or "llm"
+        :param name: What was measured, e.g. a host, model or tool name
+        :param started_at: Wall clock time of the start
+        :param seconds: Duration
+        :param fields: Further fields, e.g. bytes, prompt_tokens or cache_hit
+        """
+        record = {"task_id": self.task_id, "stage": stage, "name": name,
+                  "started_at": round(started_at, 3), "seconds": round(seconds, 6), **fields}
+        line = json.dumps(record, default=str)
+        with self._lock:
+            # Work of a failed task may still finish after the trace was closed
+            if not self._file.closed:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_trace: contextvars.ContextVar[Optional[TaskTrace]] = contextvars.ContextVar("trace", default=None)
+_span: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("span", default=None)
+
+
+def trace_path(result_path: str, task_id: str) -> str:
+    """
+    Path of the trace of a task.
+
+    Args:
+        result_path (str): Result file of the task
+        task_id (str): Task ID
+
+    Returns:
+        str: research_trace_{task_id}.jsonl in the directory of the result file
+    """
+    return os.path.join(os.path.dirname(result_path), f"{TRACE_PREFIX}{task_id}.jsonl")
+
+
+def current_trace() -> Optional[TaskTrace]:
+    """Return the trace of the task running in this context, None outside of a task."""
+    return _trace.get()
+
+
+@contextmanager
+def task_trace(task_id: str, result_path: str) -> Iterator[Optional[TaskTrace]]:
+    """
+    Trace everything a task does in this context, including coroutines and threads started from it.
+
+    Args:
+        task_id (str): Task ID
+        result_path (str): Result file of the task, the trace is written next to it
+    """
+    if not TRACING:
+        yield None
+        return
+    trace = TaskTrace(task_id, trace_path(result_path, task_id))
+    token = _trace.set(trace)
+    try:
+        with span("task", task_id):
+            yield trace
+    finally:
+        _trace.reset(token)
+        trace.close()
+
+
+@contextmanager
+def span(stage: str, name: str = "", **fields) -> Iterator[dict]:
+    """
+    Measure one operation of the current task, nothing is recorded outside of a task.
+
+    Args:
+        stage (str): Stage, e.g. "http" or "llm"
+        name (str): What is measured, e.g. a host, model or tool name
+        **fields: Fields known at the start, further ones are added to the yielded dict or with annotate
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield {}
+        return
+    record = dict(fields)
+    token = _span.set(record)
+    started_at, start = time.time(), time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        _span.reset(token)
+        trace.write(stage, name, started_at, time.perf_counter() - start, **record)
+
+
+def annotate(**fields):
+    """
+    Add fields to the innermost span of this context, e.g. the token usage of a completion.
+
+    Args:
+        **fields: Fields of the record
+    """
+    record = _span.get()
+    if record is not None:
+        record.update(fields)
+
+
+def propagate(func: Callable) -> Callable:
+    """
+    Run a function submitted to a thread pool within the trace of the submitting task.
+
+    Args:
+        func (Callable): Function passed to ThreadPoolExecutor.submit or map
+
+    Returns:
+        Callable: Function that sets the trace in the worker thread
+    """
+    trace = _trace.get()
+    if trace is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _trace.set(trace)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _trace.reset(token)
+
+    return wrapper
+
+
+def load_records(paths: Iterable[str]) -> List[dict]:
+    """
+    Read trace records.
+
+    Args:
+        paths (Iterable[str]): Trace files, or directories whose research_trace_*.jsonl files are read
+
+    Returns:
+        List[dict]: Records of all files, lines that are not valid JSON are skipped
+    """
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, f"{TRACE_PREFIX}*.jsonl")))
+                     if os.path.isdir(path) else [path])
+    records = []
+    for file_path in files:
+        with open(file_path) as trace_file:
+            for line in trace_file:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values (List[float]): Sorted values
+        q (float): Percentile between 0 and 100
+
+    Returns:
+        float: Value at the percentile
+    """
+    return values[max(int(-(-q * len(values) // 100)) - 1, 0)]
+
+
+def summarize_records(records: List[dict], by_name: bool = False) -> str:
+    """
+    Report latency percentiles, sizes and cache hit rates.
+
+    Args:
+        records (List[dict]): Trace records
+        by_name (bool): Group by stage and name instead of stage only
+
+    Returns:
+        str: One table row per group
+    """
+    groups: Dict[str, List[dict]] = defaultdict(list)
+    for record in records:
+        key = f"{record['stage']} {record['name']}" if by_name else record['stage']
+        groups[key].append(record)
+
+    width = max([len(key) for key in groups] + [5])
+    lines = [f"{'stage':<{width}} {'count':>6} {'p50 s':>8} {'p95 s':>8} {'total s':>9} "
+             f"{'MB':>8} {'tokens':>9} {'hits':>6} {'errors':>6}"]
+    for key, group in sorted(groups.items(), key=lambda item: -sum(r['seconds'] for r in item[1])):
+        seconds = sorted(record['seconds'] for record in group)
+        size = sum(record.get('bytes') or 0 for record in group) / 1e6
+        tokens = sum((record.get('prompt_tokens') or 0) + (record.get('completion_tokens') or 0)
+                     for record in group)
+        cached = [record['cache_hit'] for record in group if 'cache_hit' in record]
+        hits = f"{sum(cached) / len(cached):.0%}" if cached else "-"
+        errors = sum('error' in record for record in group)
+        lines.append(f"{key:<{width}} {len(group):>6} {percentile(seconds, 50):>8.3f} "
+                     f"{percentile(seconds, 95):>8.3f} {sum(seconds):>9.2f} {size:>8.2f} {tokens:>9} "
+                     f"{hits:>6} {errors:>6}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report p50 and p95 latency per stage of task traces")
+    parser.add_argument("paths", nargs="+", help="Trace files or directories with research_trace_*.jsonl")
+    parser.add_argument("--task", help="Only records of this task ID")
+    parser.add_argument("--by-name", action="store_true", help="Group by stage and name, e.g. per host")
+    args = parser.parse_args()
+
+    trace_records = [record for record in load_records(args.paths)
+                     if args.task is None or record.get('task_id') == args.task]
+    if not trace_records:
+        print("No trace records found")
+    else:
+        print(summarize_records(trace_records, args.by_name))